@@ -0,0 +1,39 @@
+import argparse
+import json
+import sys
+import time
+
+from chess import analyze_positions
+
+def read_fens(stream):
+    # One FEN per line; blank lines and # comments are skipped
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a batch of FEN positions with the chess AI")
+    parser.add_argument("file", nargs="?", help="file with one FEN per line (default: stdin)")
+    parser.add_argument("--movetime", type=int, default=1000, help="search time per position in ms")
+    parser.add_argument("--depth", type=int, help="search to a fixed depth instead of by time")
+    parser.add_argument("--workers", type=int, help="processes to use (default: one per CPU)")
+    parser.add_argument("--tt-size", type=int, default=16, help="transposition table size per process in MB")
+    parser.add_argument("--stats", action="store_true", help="add search statistics to each result")
+    args = parser.parse_args()
+
+    stream = open(args.file) if args.file else sys.stdin
+    time_budget_ms = None if args.depth else args.movetime
+    start = time.perf_counter()
+    done = 0
+    # Results are printed as JSON lines the moment each position finishes
+    with stream:
+        for result in analyze_positions(read_fens(stream), time_budget_ms=time_budget_ms, depth=args.depth,
+                                        workers=args.workers, tt_size_mb=args.tt_size, stats=args.stats):
+            print(json.dumps(result), flush=True)
+            done += 1
+    elapsed = time.perf_counter() - start
+    print(f"{done} positions in {elapsed:.1f}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
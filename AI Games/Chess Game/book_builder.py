@@ -0,0 +1,150 @@
+import argparse
+import random
+import re
+import sys
+from collections import Counter
+
+from chess import (ChessBoard, ChessAI, OpeningBook, GameArchive, OPENING_BOOK_PATH, INDEX_COLOR,
+                   PIECE_LETTERS, PAWN, BOARD_SIZE, encode_move, parse_square)
+
+# PGN tokens: comments, variations and annotations are dropped before moves
+# are read; castling, en passant and under-promotion aren't part of this game,
+# so a game is only followed up to the first move that needs them
+PGN_COMMENT = re.compile(r'\{[^}]*\}|;[^\n]*')
+PGN_NAG = re.compile(r'\$\d+')
+PGN_MOVE_NUMBER = re.compile(r'^\d+\.+$|^\d+\.+(?=\S)')
+PGN_RESULTS = {'1-0', '0-1', '1/2-1/2', '*'}
+SAN_MOVE = re.compile(r'^([KQRBN])?([a-h])?([1-8])?x?([a-h][1-8])(=[QRBN])?$')
+
+def parse_san(board, san):
+    # Find the legal move for a SAN string, or None if there isn't exactly one
+    san = san.rstrip('+#!?')
+    match = SAN_MOVE.match(san)
+    if not match:
+        return None
+    letter, from_file, from_rank, target, promotion = match.groups()
+    if promotion and promotion != '=Q':
+        return None
+    piece_type = PIECE_LETTERS.index(letter.lower()) if letter else PAWN
+    to_sq = parse_square(target)
+    candidates = []
+    for from_sq, move_to in board.generate_legal_moves(board.side):
+        if move_to != to_sq or board.squares[from_sq] % 6 != piece_type:
+            continue
+        row, col = divmod(from_sq, BOARD_SIZE)
+        if from_file and "abcdefgh"[col] != from_file:
+            continue
+        if from_rank and str(8 - row) != from_rank:
+            continue
+        candidates.append((from_sq, move_to))
+    return candidates[0] if len(candidates) == 1 else None
+
+def read_pgn_games(text):
+    # Yields the SAN move list of each game in a PGN file
+    moves = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('['):
+            if moves:
+                yield moves
+                moves = []
+            continue
+        moves.extend(_san_tokens(line))
+    if moves:
+        yield moves
+
+def _san_tokens(line):
+    line = PGN_NAG.sub(' ', line)
+    tokens = []
+    depth = 0
+    for token in line.replace('(', ' ( ').replace(')', ' ) ').split():
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth == 0 and token not in PGN_RESULTS:
+            token = PGN_MOVE_NUMBER.sub('', token)
+            if token:
+                tokens.append(token)
+    return tokens
+
+def add_pgn(weights, path, max_ply):
+    games = 0
+    with open(path, encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    # Headers separate games, so strip comment blocks first (they can span lines)
+    for sans in read_pgn_games(PGN_COMMENT.sub(' ', text)):
+        board = ChessBoard()
+        for san in sans[:max_ply]:
+            move = parse_san(board, san)
+            if move is None:
+                break
+            weights[(board.hash_key, encode_move(*move))] += 1
+            board.make_move(*move)
+        games += 1
+    return games
+
+def add_archive(weights, path, max_ply):
+    # Games from a game archive (e.g. tournament.py --archive)
+    archive = GameArchive(path)
+    try:
+        for index in range(len(archive)):
+            _, _, moves = archive.game(index)
+            for ply, board in enumerate(archive.replay(index)):
+                if ply >= min(max_ply, len(moves)):
+                    break
+                # Book moves are stored without the promotion flag
+                weights[(board.hash_key, moves[ply] & 0xFFF)] += 1
+        return len(archive)
+    finally:
+        archive.close()
+
+def add_self_play(weights, games, max_ply, movetime_ms, random_plies, seed):
+    # The engine is deterministic, so the first few plies of each game are
+    # random to get different lines
+    rng = random.Random(seed)
+    for game in range(games):
+        board = ChessBoard()
+        players = [ChessAI(board, INDEX_COLOR[side]) for side in (0, 1)]
+        for ply in range(max_ply):
+            moves = board.generate_legal_moves(board.side)
+            if not moves:
+                break
+            if ply < random_plies:
+                move = rng.choice(moves)
+            else:
+                from_row, from_col, to_row, to_col = players[board.side].get_move(time_budget_ms=movetime_ms)
+                move = (from_row * BOARD_SIZE + from_col, to_row * BOARD_SIZE + to_col)
+                weights[(board.hash_key, encode_move(*move))] += 1
+            board.make_move(*move)
+        print(f"Self-play game {game + 1}/{games} done", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the chess AI's opening book")
+    parser.add_argument("pgn", nargs="*", help="PGN files to read games from")
+    parser.add_argument("-o", "--output", default=OPENING_BOOK_PATH, help="book file to write")
+    parser.add_argument("--max-ply", type=int, default=16, help="only book the first N plies of each game")
+    parser.add_argument("--archive", action="append", default=[], help="game archive to read games from")
+    parser.add_argument("--self-play", type=int, default=0, metavar="GAMES", help="add N engine self-play games")
+    parser.add_argument("--movetime", type=int, default=200, help="self-play time per move in ms")
+    parser.add_argument("--random-plies", type=int, default=2, help="random opening plies in self-play")
+    parser.add_argument("--seed", type=int, default=1, help="self-play random seed")
+    args = parser.parse_args()
+
+    if not args.pgn and not args.archive and not args.self_play:
+        parser.error("give PGN files, --archive files and/or --self-play GAMES")
+
+    weights = Counter()
+    for path in args.pgn:
+        print(f"{path}: {add_pgn(weights, path, args.max_ply)} games", file=sys.stderr)
+    for path in args.archive:
+        print(f"{path}: {add_archive(weights, path, args.max_ply)} games", file=sys.stderr)
+    if args.self_play:
+        add_self_play(weights, args.self_play, args.max_ply, args.movetime, args.random_plies, args.seed)
+
+    OpeningBook.write(args.output, weights)
+    positions = len({key for key, _ in weights})
+    print(f"Wrote {len(weights)} moves for {positions} positions to {args.output}")
+
+if __name__ == "__main__":
+    main()
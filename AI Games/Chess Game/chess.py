@@ -1,17 +1,29 @@
-import pygame
 import sys
-import copy
+import time
+import json
+import hashlib
+import logging
+import mmap
+import struct
+import random
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from array import array
 from enum import Enum
 import os
 
-# Initialize pygame
-pygame.init()
-
 # Constants
 WIDTH, HEIGHT = 640, 680  # Increased height for status area
 BOARD_SIZE = 8
 SQUARE_SIZE = WIDTH // BOARD_SIZE
 FPS = 60
+AI_MOVE_TIME_MS = 1000  # Time the AI may think about each move
+AI_WORKERS = 1  # Search processes for the AI; raise to the number of CPU cores
+AI_SEARCH_STATS = True  # Collect search statistics and show them in the status bar
+AI_PONDER = True  # Keep searching during the human's turn
+AI_PONDER_TIME_MS = 5 * AI_MOVE_TIME_MS  # Longest ponder; then the AI waits for the human
+OPENING_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening_book.bin')
 
 # Colors
 WHITE = (255, 255, 255)
@@ -24,37 +36,131 @@ GREEN = (0, 128, 0)
 BLUE = (0, 0, 255)
 STATUS_BG = (240, 240, 240)
 
-# Set up the display
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Chess with AI")
-clock = pygame.time.Clock()
+# Set up the display (in init_display, so the rules and the AI can be used
+# by headless tools without opening a window). pygame itself is only imported
+# there, so those tools don't need it installed or pay for its startup.
+pygame = None
+screen = None
+clock = None
 
-# Try to load fonts that support chess symbols
-def get_chess_font(size):
-    # List of fonts that support chess symbols
-    chess_fonts = [
-        'Segoe UI Symbol',
-        'Arial Unicode MS',
-        'DejaVu Sans',
-        'FreeSerif',
-        'Quivira',
-        'Code2000',
-        'Lucida Sans Unicode',
-        'Times New Roman'
-    ]
-    
-    for font_name in chess_fonts:
+def init_display():
+    global pygame, screen, clock
+    import pygame
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Chess with AI")
+    clock = pygame.time.Clock()
+
+# Fonts that support chess symbols, tried in order, and the font for text
+CHESS_FONTS = [
+    'Segoe UI Symbol',
+    'Arial Unicode MS',
+    'DejaVu Sans',
+    'FreeSerif',
+    'Quivira',
+    'Code2000',
+    'Lucida Sans Unicode',
+    'Times New Roman'
+]
+TEXT_FONT = 'Arial'
+
+# Finding system fonts makes pygame scan them (fc-list on Linux), which can
+# take seconds, so the fonts found are kept on disk between launches
+def user_cache_dir():
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'ai-course-chess')
+
+FONT_CACHE_PATH = os.path.join(user_cache_dir(), 'fonts.json')
+
+def font_directories():
+    # Where the system keeps fonts, plus fontconfig's configuration on Linux
+    if sys.platform == 'win32':
+        return [os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'),
+                os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft', 'Windows', 'Fonts')]
+    if sys.platform == 'darwin':
+        return ['/System/Library/Fonts', '/Library/Fonts', os.path.expanduser('~/Library/Fonts')]
+    data_home = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+    return ['/usr/share/fonts', '/usr/local/share/fonts', os.path.join(data_home, 'fonts'),
+            os.path.expanduser('~/.fonts'), '/etc/fonts', os.environ.get('FONTCONFIG_FILE', '')]
+
+def font_cache_key():
+    # Changes with the font lists, pygame's version or the modification time
+    # of any font directory (or one level below it, where font packages put
+    # theirs) or fontconfig file, i.e. whenever a font is added or removed
+    state = [CHESS_FONTS, TEXT_FONT, pygame.version.ver, sys.platform]
+    for directory in font_directories():
+        try:
+            state.append((directory, os.stat(directory).st_mtime_ns))
+            with os.scandir(directory) as entries:
+                state.extend(sorted((entry.name, entry.stat().st_mtime_ns)
+                                    for entry in entries if entry.is_dir()))
+        except OSError:
+            continue
+    return hashlib.sha1(json.dumps(state).encode()).hexdigest()
+
+def probe_fonts():
+    # The first chess font that is installed and renders a king, the text
+    # font (None means pygame's default font for either) and whether the
+    # piece symbols can be drawn
+    chess_font = None
+    for font_name in CHESS_FONTS:
+        path = pygame.font.match_font(font_name)
+        if path is None:
+            continue
         try:
-            font = pygame.font.SysFont(font_name, size)
             # Test if the font supports chess symbols by rendering a king
-            test_surface = font.render('♔', True, BLACK)
-            if test_surface.get_width() > 0:  # If it rendered successfully
-                return font
-        except:
+            if pygame.font.Font(path, 48).render('♔', True, BLACK).get_width() > 0:
+                chess_font = path
+                break
+        except (OSError, pygame.error):
             continue
-    
-    # Fallback to default font with text representations
-    return pygame.font.SysFont('Arial', size)
+    text_font = pygame.font.match_font(TEXT_FONT)
+    test_surface = pygame.font.Font(chess_font or text_font, 48).render('♔', True, BLACK)
+    return {'chess_font': chess_font, 'text_font': text_font, 'unicode': test_surface.get_width() > 5}
+
+_fonts = None
+
+def discover_fonts():
+    # probe_fonts, from FONT_CACHE_PATH when it was written for the same
+    # fonts; a cache that can't be read or written is just skipped
+    global _fonts
+    if _fonts is not None:
+        return _fonts
+    key = font_cache_key()
+    try:
+        with open(FONT_CACHE_PATH, encoding='utf-8') as f:
+            cached = json.load(f)
+        paths = (cached['chess_font'], cached['text_font'])
+        if cached['key'] == key and all(path is None or os.path.exists(path) for path in paths):
+            _fonts = cached
+            return _fonts
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    _fonts = dict(probe_fonts(), key=key)
+    try:
+        os.makedirs(os.path.dirname(FONT_CACHE_PATH), exist_ok=True)
+        # Written aside and renamed, so a second game starting can't read half a file
+        temp_path = f"{FONT_CACHE_PATH}.{os.getpid()}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(_fonts, f)
+        os.replace(temp_path, FONT_CACHE_PATH)
+    except OSError:
+        pass
+    return _fonts
+
+# Try to load fonts that support chess symbols
+def get_chess_font(size):
+    fonts = discover_fonts()
+    # Fallback to the text font with text representations
+    return pygame.font.Font(fonts['chess_font'] or fonts['text_font'], size)
+
+def get_text_font(size):
+    return pygame.font.Font(discover_fonts()['text_font'], size)
 
 # Chess piece Unicode symbols with fallback text
 class PieceType(Enum):
@@ -70,540 +176,2121 @@ class PieceColor(Enum):
     BLACK = 2
 
 class Piece:
-    def __init__(self, piece_type, color):
+    # Read-only view of a square for the pygame layer. Boards store integer
+    # piece codes; get_piece hands out the shared instances in PIECES, so no
+    # Piece is ever built per square or per search node.
+    __slots__ = ('piece_type', 'color', 'code', 'has_moved')
+
+    def __init__(self, piece_type, color, has_moved=False):
         self.piece_type = piece_type
         self.color = color
-        self.has_moved = False
-        
+        self.code = (color.value - 1) * 6 + piece_type.value - 1
+        self.has_moved = has_moved
+
     def get_symbol(self):
         # Unicode chess symbols
-        symbols_white = {
-            PieceType.KING: '♔',
-            PieceType.QUEEN: '♕',
-            PieceType.ROOK: '♖',
-            PieceType.BISHOP: '♗',
-            PieceType.KNIGHT: '♘',
-            PieceType.PAWN: '♙'
-        }
-        symbols_black = {
-            PieceType.KING: '♚',
-            PieceType.QUEEN: '♛',
-            PieceType.ROOK: '♜',
-            PieceType.BISHOP: '♝',
-            PieceType.KNIGHT: '♞',
-            PieceType.PAWN: '♟'
-        }
-        
-        if self.color == PieceColor.WHITE:
-            return symbols_white[self.piece_type]
-        else:
-            return symbols_black[self.piece_type]
-    
+        return PIECE_SYMBOLS[self.code]
+
     def get_text_fallback(self):
         # Text fallback for when Unicode symbols don't work
-        text_white = {
-            PieceType.KING: 'K',
-            PieceType.QUEEN: 'Q',
-            PieceType.ROOK: 'R',
-            PieceType.BISHOP: 'B',
-            PieceType.KNIGHT: 'N',
-            PieceType.PAWN: 'P'
-        }
-        text_black = {
-            PieceType.KING: 'k',
-            PieceType.QUEEN: 'q',
-            PieceType.ROOK: 'r',
-            PieceType.BISHOP: 'b',
-            PieceType.KNIGHT: 'n',
-            PieceType.PAWN: 'p'
-        }
-        
-        if self.color == PieceColor.WHITE:
-            return text_white[self.piece_type]
-        else:
-            return text_black[self.piece_type]
-    
+        return PIECE_TEXT[self.code]
+
     def get_name(self):
-        names = {
-            PieceType.KING: 'King',
-            PieceType.QUEEN: 'Queen',
-            PieceType.ROOK: 'Rook',
-            PieceType.BISHOP: 'Bishop',
-            PieceType.KNIGHT: 'Knight',
-            PieceType.PAWN: 'Pawn'
-        }
-        return names[self.piece_type]
+        return PIECE_NAMES[self.code % 6]
+
+# Bitboard position model
+# Squares are numbered row * 8 + col, the same (row, col) layout the pygame
+# layer uses, so square 0 is a8 and square 63 is h1. Each piece type and color
+# gets its own 64-bit integer, indexed by the piece code color * 6 + type.
+WHITE_IDX, BLACK_IDX = 0, 1
+PAWN, ROOK, KNIGHT, BISHOP, QUEEN, KING = range(6)
+
+COLOR_INDEX = {PieceColor.WHITE: WHITE_IDX, PieceColor.BLACK: BLACK_IDX}
+INDEX_COLOR = (PieceColor.WHITE, PieceColor.BLACK)
+TYPE_INDEX = {piece_type: piece_type.value - 1 for piece_type in PieceType}
+INDEX_TYPE = tuple(PieceType)
+# FEN letters by piece type (upper case for White)
+PIECE_LETTERS = 'prnbqk'
+# Display tables by piece code
+PIECE_SYMBOLS = '♙♖♘♗♕♔♟♜♞♝♛♚'
+PIECE_TEXT = PIECE_LETTERS.upper() + PIECE_LETTERS
+PIECE_NAMES = ('Pawn', 'Rook', 'Knight', 'Bishop', 'Queen', 'King')
+# Shared Piece instances, PIECES[has_moved][code]
+PIECES = tuple(tuple(Piece(INDEX_TYPE[code % 6], INDEX_COLOR[code // 6], has_moved) for code in range(12))
+               for has_moved in (False, True))
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1'
+
+FULL_BB = (1 << 64) - 1
+FILE_A = sum(1 << (row * BOARD_SIZE) for row in range(BOARD_SIZE))
+FILE_H = FILE_A << 7
+ROW_BB = [0xFF << (row * BOARD_SIZE) for row in range(BOARD_SIZE)]
+PROMOTION_BB = ROW_BB[0] | ROW_BB[7]
+MOVE_CACHE_SIZE = 32  # Positions whose legal moves the rules layer keeps
+
+# Moves are packed into 16 bits: from square, to square << 6, and flags from
+# bit 12 up. Promotions (always to a queen) carry MOVE_PROMOTION.
+MOVE_PROMOTION = 1 << 12
+
+KNIGHT_OFFSETS = [
+    (2, 1), (2, -1), (-2, 1), (-2, -1),
+    (1, 2), (1, -2), (-1, 2), (-1, -2)
+]
+KING_OFFSETS = [
+    (1, 0), (-1, 0), (0, 1), (0, -1),
+    (1, 1), (1, -1), (-1, 1), (-1, -1)
+]
+# Slider directions: the first four are rook rays, the last four bishop rays
+DIRECTIONS = [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+ROOK_DIRECTIONS = (0, 1, 2, 3)
+BISHOP_DIRECTIONS = (4, 5, 6, 7)
+# Rays that run towards higher square numbers find their first blocker at the
+# lowest set bit, the others at the highest set bit
+RAY_POSITIVE = [dr > 0 or (dr == 0 and dc > 0) for dr, dc in DIRECTIONS]
+
+def square_bb(row, col):
+    return 1 << (row * BOARD_SIZE + col)
+
+def bb_squares(bb):
+    squares = []
+    while bb:
+        lsb = bb & -bb
+        squares.append(lsb.bit_length() - 1)
+        bb ^= lsb
+    return squares
+
+def _leaper_attacks(offsets):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, BOARD_SIZE)
+        bb = 0
+        for dr, dc in offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+                bb |= square_bb(r, c)
+        table.append(bb)
+    return table
+
+def _ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, BOARD_SIZE)
+        bb = 0
+        r, c = row + dr, col + dc
+        while 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+            bb |= square_bb(r, c)
+            r, c = r + dr, c + dc
+        table.append(bb)
+    return table
+
+KNIGHT_ATTACKS = _leaper_attacks(KNIGHT_OFFSETS)
+KING_ATTACKS = _leaper_attacks(KING_OFFSETS)
+# Squares attacked by a pawn of each color standing on a square
+PAWN_ATTACKS = (_leaper_attacks([(-1, -1), (-1, 1)]), _leaper_attacks([(1, -1), (1, 1)]))
+RAYS = [_ray_table(dr, dc) for dr, dc in DIRECTIONS]
+
+def _relevant_mask(sq, directions):
+    # The last square of a ray never changes the attack set, so leave it out
+    mask = 0
+    for d in directions:
+        ray = RAYS[d][sq]
+        if ray:
+            edge = ray & -ray if not RAY_POSITIVE[d] else 1 << (ray.bit_length() - 1)
+            mask |= ray ^ edge
+    return mask
+
+ROOK_MASKS = [_relevant_mask(sq, ROOK_DIRECTIONS) for sq in range(64)]
+BISHOP_MASKS = [_relevant_mask(sq, BISHOP_DIRECTIONS) for sq in range(64)]
+# Slider attacks are memoized per square on the relevant occupancy, so each
+# blocker pattern is only traced along its rays once
+_ROOK_CACHE = [{} for _ in range(64)]
+_BISHOP_CACHE = [{} for _ in range(64)]
+
+def _slider_attacks(sq, occupied, directions):
+    attacks = 0
+    for d in directions:
+        ray = RAYS[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            if RAY_POSITIVE[d]:
+                blocker_sq = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker_sq = blockers.bit_length() - 1
+            ray ^= RAYS[d][blocker_sq]
+        attacks |= ray
+    return attacks
+
+def rook_attacks(sq, occupied):
+    key = occupied & ROOK_MASKS[sq]
+    cache = _ROOK_CACHE[sq]
+    attacks = cache.get(key)
+    if attacks is None:
+        attacks = cache[key] = _slider_attacks(sq, key, ROOK_DIRECTIONS)
+    return attacks
+
+def bishop_attacks(sq, occupied):
+    key = occupied & BISHOP_MASKS[sq]
+    cache = _BISHOP_CACHE[sq]
+    attacks = cache.get(key)
+    if attacks is None:
+        attacks = cache[key] = _slider_attacks(sq, key, BISHOP_DIRECTIONS)
+    return attacks
+
+def queen_attacks(sq, occupied):
+    return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+
+# Zobrist keys, drawn from a fixed seed so a position hashes the same in every
+# process (transposition tables and books can then be shared between runs)
+_zobrist_rng = random.Random(0x5EED)
+ZOBRIST_PIECES = [[_zobrist_rng.getrandbits(64) for _ in range(64)] for _ in range(12)]
+ZOBRIST_SIDE = _zobrist_rng.getrandbits(64)
+
+def piece_attacks(code, sq, occupied):
+    # Squares attacked by the piece with this code standing on sq
+    piece_type = code % 6
+    if piece_type == PAWN:
+        return PAWN_ATTACKS[code // 6][sq]
+    if piece_type == KNIGHT:
+        return KNIGHT_ATTACKS[sq]
+    if piece_type == BISHOP:
+        return bishop_attacks(sq, occupied)
+    if piece_type == ROOK:
+        return rook_attacks(sq, occupied)
+    if piece_type == QUEEN:
+        return queen_attacks(sq, occupied)
+    return KING_ATTACKS[sq]
+
+# Evaluation tables
+# Material values (centipawns) and piece-square tables indexed by piece type,
+# written from White's side with rank 8 on the first line. Middlegame and
+# endgame scores are kept apart and blended by the game phase, which starts at
+# TOTAL_PHASE and drops as minor and major pieces come off the board.
+PIECE_VALUES = [100, 500, 320, 330, 900, 20000]
+PHASE_WEIGHTS = [0, 2, 1, 1, 4, 0]
+TOTAL_PHASE = 24
+
+PAWN_MG_TABLE = [
+     0,   0,   0,   0,   0,   0,   0,   0,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    10,  10,  20,  30,  30,  20,  10,  10,
+     5,   5,  10,  25,  25,  10,   5,   5,
+     0,   0,   0,  20,  20,   0,   0,   0,
+     5,  -5, -10,   0,   0, -10,  -5,   5,
+     5,  10,  10, -20, -20,  10,  10,   5,
+     0,   0,   0,   0,   0,   0,   0,   0,
+]
+PAWN_EG_TABLE = [
+     0,   0,   0,   0,   0,   0,   0,   0,
+    80,  80,  80,  80,  80,  80,  80,  80,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    30,  30,  30,  30,  30,  30,  30,  30,
+    20,  20,  20,  20,  20,  20,  20,  20,
+    10,  10,  10,  10,  10,  10,  10,  10,
+     0,   0,   0,   0,   0,   0,   0,   0,
+     0,   0,   0,   0,   0,   0,   0,   0,
+]
+KNIGHT_TABLE = [
+   -50, -40, -30, -30, -30, -30, -40, -50,
+   -40, -20,   0,   0,   0,   0, -20, -40,
+   -30,   0,  10,  15,  15,  10,   0, -30,
+   -30,   5,  15,  20,  20,  15,   5, -30,
+   -30,   0,  15,  20,  20,  15,   0, -30,
+   -30,   5,  10,  15,  15,  10,   5, -30,
+   -40, -20,   0,   5,   5,   0, -20, -40,
+   -50, -40, -30, -30, -30, -30, -40, -50,
+]
+BISHOP_TABLE = [
+   -20, -10, -10, -10, -10, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,  10,  10,   5,   0, -10,
+   -10,   5,   5,  10,  10,   5,   5, -10,
+   -10,   0,  10,  10,  10,  10,   0, -10,
+   -10,  10,  10,  10,  10,  10,  10, -10,
+   -10,   5,   0,   0,   0,   0,   5, -10,
+   -20, -10, -10, -10, -10, -10, -10, -20,
+]
+ROOK_TABLE = [
+     0,   0,   0,   0,   0,   0,   0,   0,
+     5,  10,  10,  10,  10,  10,  10,   5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+     0,   0,   0,   5,   5,   0,   0,   0,
+]
+QUEEN_TABLE = [
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,   5,   5,   5,   0, -10,
+    -5,   0,   5,   5,   5,   5,   0,  -5,
+     0,   0,   5,   5,   5,   5,   0,  -5,
+   -10,   5,   5,   5,   5,   5,   0, -10,
+   -10,   0,   5,   0,   0,   0,   0, -10,
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+]
+KING_MG_TABLE = [
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -20, -30, -30, -40, -40, -30, -30, -20,
+   -10, -20, -20, -20, -20, -20, -20, -10,
+    20,  20,   0,   0,   0,   0,  20,  20,
+    20,  30,  10,   0,   0,  10,  30,  20,
+]
+KING_EG_TABLE = [
+   -50, -40, -30, -20, -20, -30, -40, -50,
+   -30, -20, -10,   0,   0, -10, -20, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -30,   0,   0,   0,   0, -30, -30,
+   -50, -30, -30, -30, -30, -30, -30, -50,
+]
+MG_TABLES = [PAWN_MG_TABLE, ROOK_TABLE, KNIGHT_TABLE, BISHOP_TABLE, QUEEN_TABLE, KING_MG_TABLE]
+EG_TABLES = [PAWN_EG_TABLE, ROOK_TABLE, KNIGHT_TABLE, BISHOP_TABLE, QUEEN_TABLE, KING_EG_TABLE]
+
+def _scored_tables(tables):
+    # Per piece code and square: material plus table bonus, positive for
+    # White and negative for Black (whose squares are mirrored vertically)
+    scored = []
+    for color in (WHITE_IDX, BLACK_IDX):
+        for piece_type in range(6):
+            table = tables[piece_type]
+            if color == WHITE_IDX:
+                scored.append([PIECE_VALUES[piece_type] + table[sq] for sq in range(64)])
+            else:
+                scored.append([-(PIECE_VALUES[piece_type] + table[sq ^ 56]) for sq in range(64)])
+    return scored
+
+PST_MG = _scored_tables(MG_TABLES)
+PST_EG = _scored_tables(EG_TABLES)
 
 class ChessBoard:
-    def __init__(self):
-        self.board = [[None for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
+    def __init__(self, fen=None):
         self.selected_piece = None
         self.valid_moves = []
-        self.turn = PieceColor.WHITE
         self.game_over = False
         self.winner = None
         self.check = False
-        self.setup_board()
-        
+        if fen is None:
+            self.setup_board()
+        else:
+            self.load_fen(fen)
+
+    def clear(self):
+        # One bitboard per piece code, occupancy per color and a square -> code
+        # lookup so captures don't have to search the bitboards
+        self.pieces = [0] * 12
+        self.occupied = [0, 0]
+        self.squares = [None] * 64
+        self.side = WHITE_IDX
+        self.unmoved = 0
+        self.history = []
+        # FEN move number of the position before the first move in history
+        self.first_move_number = 1
+        self.hash_key = 0
+        # Incremental evaluation terms, from White's point of view
+        self.mg_score = 0
+        self.eg_score = 0
+        self.phase = 0
+        # Attack map cache: the squares each piece attacks and the per-color
+        # unions built from it. It is brought up to date incrementally the next
+        # time a map is needed, so moves made inside a search don't pay for it.
+        # attacks_ply is the history length the cache matches (-1 when stale)
+        # and attack_undo holds, per synced move, the entries it changed.
+        self.square_attacks = [0] * 64
+        self.attack_maps = [None, None]
+        self.attacks_ply = -1
+        self.attack_undo = []
+        # Legal moves for the rules layer, see rules_moves
+        self.move_cache = {}
+
     def setup_board(self):
         # Clear the board
-        self.board = [[None for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
-        
+        self.clear()
+
+        # Pieces are placed directly and the position refreshed once at the
+        # end, rather than by put_piece, which refreshes after every piece
+        black = BLACK_IDX * 6
+        white = WHITE_IDX * 6
+
         # Set up pawns
         for col in range(BOARD_SIZE):
-            self.board[1][col] = Piece(PieceType.PAWN, PieceColor.BLACK)
-            self.board[6][col] = Piece(PieceType.PAWN, PieceColor.WHITE)
-        
+            self._add_piece(black + PAWN, BOARD_SIZE + col)
+            self._add_piece(white + PAWN, 6 * BOARD_SIZE + col)
+
         # Set up other pieces
-        back_row = [PieceType.ROOK, PieceType.KNIGHT, PieceType.BISHOP, PieceType.QUEEN,
-                   PieceType.KING, PieceType.BISHOP, PieceType.KNIGHT, PieceType.ROOK]
-        
+        back_row = [ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK]
+
         for col, piece_type in enumerate(back_row):
-            self.board[0][col] = Piece(piece_type, PieceColor.BLACK)
-            self.board[7][col] = Piece(piece_type, PieceColor.WHITE)
-    
+            self._add_piece(black + piece_type, col)
+            self._add_piece(white + piece_type, 7 * BOARD_SIZE + col)
+
+        self.unmoved = self.occupied[WHITE_IDX] | self.occupied[BLACK_IDX]
+        self._refresh_position()
+
+    def load_fen(self, fen):
+        # Set up the position from a FEN string. The castling and en passant
+        # fields are accepted but ignored, since the game has neither rule.
+        fields = fen.split()
+        if len(fields) < 2 or fields[1] not in ('w', 'b'):
+            raise ValueError(f"Invalid FEN: {fen!r}")
+        rows = fields[0].split('/')
+        if len(rows) != BOARD_SIZE:
+            raise ValueError(f"Invalid FEN: {fen!r}")
+
+        self.clear()
+        for row, text in enumerate(rows):
+            col = 0
+            for char in text:
+                if char.isdigit():
+                    col += int(char)
+                    continue
+                piece_type = PIECE_LETTERS.find(char.lower())
+                if piece_type < 0 or col >= BOARD_SIZE:
+                    raise ValueError(f"Invalid FEN: {fen!r}")
+                color = WHITE_IDX if char.isupper() else BLACK_IDX
+                self._add_piece(color * 6 + piece_type, row * BOARD_SIZE + col)
+                col += 1
+            if col != BOARD_SIZE:
+                raise ValueError(f"Invalid FEN: {fen!r}")
+        self.side = WHITE_IDX if fields[1] == 'w' else BLACK_IDX
+        if len(fields) > 5 and fields[5].isdigit():
+            self.first_move_number = max(1, int(fields[5]))
+
+        # Pawns away from their starting row have moved
+        moved_pawns = ((self.pieces[WHITE_IDX * 6 + PAWN] & ~ROW_BB[6])
+                       | (self.pieces[BLACK_IDX * 6 + PAWN] & ~ROW_BB[1]))
+        self.unmoved = (self.occupied[WHITE_IDX] | self.occupied[BLACK_IDX]) & ~moved_pawns
+        self._refresh_position()
+
+        self.selected_piece = None
+        self.valid_moves = []
+        self.game_over = False
+        self.winner = None
+        self.check = self.is_in_check(self.turn)
+        if self.is_checkmate(self.turn):
+            self.game_over = True
+            self.winner = INDEX_COLOR[self.side ^ 1]
+
+    def get_fen(self):
+        # FEN of the position. Castling and en passant are always '-' and the
+        # halfmove clock 0, since the game has none of those rules.
+        rows = []
+        for row in range(BOARD_SIZE):
+            text = ''
+            empty = 0
+            for code in self.squares[row * BOARD_SIZE:(row + 1) * BOARD_SIZE]:
+                if code is None:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                letter = PIECE_LETTERS[code % 6]
+                text += letter.upper() if code // 6 == WHITE_IDX else letter
+            if empty:
+                text += str(empty)
+            rows.append(text)
+        # The move number goes up after each Black move
+        move_number = self.first_move_number + sum(1 for entry in self.history if entry[2] // 6 == BLACK_IDX)
+        side = 'w' if self.side == WHITE_IDX else 'b'
+        return f"{'/'.join(rows)} {side} - - 0 {move_number}"
+
+    def _refresh_position(self):
+        # Recompute everything derived from the pieces after a direct edit
+        self.hash_key = self.compute_hash()
+        self.compute_eval_terms()
+        self._refresh_attacks()
+
+    @property
+    def turn(self):
+        return INDEX_COLOR[self.side]
+
+    @turn.setter
+    def turn(self, color):
+        side = COLOR_INDEX[color]
+        if side != self.side:
+            self.hash_key ^= ZOBRIST_SIDE
+        self.side = side
+
+    def compute_eval_terms(self):
+        self.mg_score = 0
+        self.eg_score = 0
+        self.phase = 0
+        for sq, code in enumerate(self.squares):
+            if code is not None:
+                self.mg_score += PST_MG[code][sq]
+                self.eg_score += PST_EG[code][sq]
+                self.phase += PHASE_WEIGHTS[code % 6]
+
+    def compute_hash(self):
+        key = ZOBRIST_SIDE if self.side == BLACK_IDX else 0
+        for sq, code in enumerate(self.squares):
+            if code is not None:
+                key ^= ZOBRIST_PIECES[code][sq]
+        return key
+
+    @property
+    def board(self):
+        # 8x8 grid of Piece objects for code written against the old list board
+        return [[self.get_piece(r, c) for c in range(BOARD_SIZE)] for r in range(BOARD_SIZE)]
+
+    def put_piece(self, row, col, piece_type, color):
+        sq = row * BOARD_SIZE + col
+        if self.squares[sq] is not None:
+            self._remove_piece(sq)
+        self._add_piece(COLOR_INDEX[color] * 6 + TYPE_INDEX[piece_type], sq)
+        self._refresh_position()
+
+    def _add_piece(self, code, sq):
+        bit = 1 << sq
+        self.pieces[code] |= bit
+        self.occupied[code // 6] |= bit
+        self.squares[sq] = code
+
+    def _remove_piece(self, sq):
+        code = self.squares[sq]
+        bit = 1 << sq
+        self.pieces[code] ^= bit
+        self.occupied[code // 6] ^= bit
+        self.squares[sq] = None
+        return code
+
     def get_piece(self, row, col):
+        # Adapter for the pygame layer: the shared Piece for the square
         if 0 <= row < BOARD_SIZE and 0 <= col < BOARD_SIZE:
-            return self.board[row][col]
+            sq = row * BOARD_SIZE + col
+            code = self.squares[sq]
+            if code is None:
+                return None
+            return PIECES[not (self.unmoved >> sq) & 1][code]
         return None
-    
+
     def select_piece(self, row, col):
-        piece = self.get_piece(row, col)
-        if piece and piece.color == self.turn:
+        code = self.squares[row * BOARD_SIZE + col]
+        if code is not None and code // 6 == self.side:
             self.selected_piece = (row, col)
             self.valid_moves = self.get_valid_moves(row, col)
             return True
         return False
-    
+
     def move_piece(self, from_row, from_col, to_row, to_col):
-        piece = self.get_piece(from_row, from_col)
-        if not piece:
+        if self.squares[from_row * BOARD_SIZE + from_col] is None:
             return False
-            
+
         # Check if the move is valid
         if (to_row, to_col) not in self.get_valid_moves(from_row, from_col):
             return False
-            
-        # Make the move
-        captured_piece = self.board[to_row][to_col]
-        self.board[to_row][to_col] = piece
-        self.board[from_row][from_col] = None
-        piece.has_moved = True
-        
-        # Check for pawn promotion
-        if piece.piece_type == PieceType.PAWN:
-            if (piece.color == PieceColor.WHITE and to_row == 0) or \
-               (piece.color == PieceColor.BLACK and to_row == 7):
-                self.board[to_row][to_col] = Piece(PieceType.QUEEN, piece.color)
-        
-        # Switch turns
-        self.turn = PieceColor.BLACK if self.turn == PieceColor.WHITE else PieceColor.WHITE
-        
+
+        # Make the move (promotion and the turn switch happen in make_move)
+        self.make_move(from_row * BOARD_SIZE + from_col, to_row * BOARD_SIZE + to_col)
+
         # Check for check and checkmate
         self.check = self.is_in_check(self.turn)
         if self.is_checkmate(self.turn):
             self.game_over = True
             self.winner = PieceColor.BLACK if self.turn == PieceColor.WHITE else PieceColor.WHITE
-        
+
         return True
-    
-    def get_valid_moves(self, row, col):
-        piece = self.get_piece(row, col)
-        if not piece:
-            return []
-            
-        moves = []
-        
-        if piece.piece_type == PieceType.PAWN:
-            moves = self.get_pawn_moves(row, col, piece)
-        elif piece.piece_type == PieceType.ROOK:
-            moves = self.get_rook_moves(row, col, piece)
-        elif piece.piece_type == PieceType.KNIGHT:
-            moves = self.get_knight_moves(row, col, piece)
-        elif piece.piece_type == PieceType.BISHOP:
-            moves = self.get_bishop_moves(row, col, piece)
-        elif piece.piece_type == PieceType.QUEEN:
-            moves = self.get_queen_moves(row, col, piece)
-        elif piece.piece_type == PieceType.KING:
-            moves = self.get_king_moves(row, col, piece)
-            
-        # Filter out moves that would put or leave the king in check
-        valid_moves = []
-        for move in moves:
-            if not self.would_be_in_check(row, col, move[0], move[1], piece.color):
-                valid_moves.append(move)
-                
-        return valid_moves
-    
-    def get_pawn_moves(self, row, col, piece):
-        moves = []
-        direction = -1 if piece.color == PieceColor.WHITE else 1
-        
-        # Move forward one square
-        if self.get_piece(row + direction, col) is None:
-            moves.append((row + direction, col))
-            
-            # Move forward two squares from starting position
-            if not piece.has_moved and self.get_piece(row + 2 * direction, col) is None:
-                moves.append((row + 2 * direction, col))
-        
-        # Capture diagonally
-        for offset in [-1, 1]:
-            target_piece = self.get_piece(row + direction, col + offset)
-            if target_piece and target_piece.color != piece.color:
-                moves.append((row + direction, col + offset))
-                
-        return moves
-    
-    def get_rook_moves(self, row, col, piece):
-        moves = []
-        directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
-        
-        for dr, dc in directions:
-            for i in range(1, BOARD_SIZE):
-                r, c = row + i * dr, col + i * dc
-                if not (0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE):
-                    break
-                    
-                target_piece = self.get_piece(r, c)
-                if target_piece is None:
-                    moves.append((r, c))
-                elif target_piece.color != piece.color:
-                    moves.append((r, c))
-                    break
+
+    def make_move(self, from_sq, to_sq):
+        # Play a move in place and push what is needed to take it back: the
+        # captured piece, the promotion, the has_moved flags and the previous turn
+        squares = self.squares
+        pieces = self.pieces
+        occupied = self.occupied
+        code = squares[from_sq]
+        captured = squares[to_sq]
+        color = code // 6
+        from_bit = 1 << from_sq
+        to_bit = 1 << to_sq
+
+        if captured is not None:
+            pieces[captured] ^= to_bit
+            occupied[color ^ 1] ^= to_bit
+
+        # Check for pawn promotion
+        promotion = code % 6 == PAWN and (to_sq < 8 or to_sq >= 56)
+        moved = code + QUEEN - PAWN if promotion else code
+
+        pieces[code] ^= from_bit
+        pieces[moved] |= to_bit
+        occupied[color] ^= from_bit | to_bit
+        squares[from_sq] = None
+        squares[to_sq] = moved
+
+        self.history.append((from_sq, to_sq, code, captured, promotion, self.unmoved, self.side,
+                             self.hash_key, self.mg_score, self.eg_score, self.phase))
+        self.unmoved &= ~(from_bit | to_bit)
+
+        # Update the evaluation terms with the pieces that changed
+        self.mg_score += PST_MG[moved][to_sq] - PST_MG[code][from_sq]
+        self.eg_score += PST_EG[moved][to_sq] - PST_EG[code][from_sq]
+        if captured is not None:
+            self.mg_score -= PST_MG[captured][to_sq]
+            self.eg_score -= PST_EG[captured][to_sq]
+            self.phase -= PHASE_WEIGHTS[captured % 6]
+        if promotion:
+            self.phase += PHASE_WEIGHTS[QUEEN]
+
+        # Update the Zobrist key with the pieces that changed
+        key = self.hash_key ^ ZOBRIST_PIECES[code][from_sq] ^ ZOBRIST_PIECES[moved][to_sq]
+        if captured is not None:
+            key ^= ZOBRIST_PIECES[captured][to_sq]
+
+        # Switch turns
+        if self.side == color:
+            key ^= ZOBRIST_SIDE
+        self.side = color ^ 1
+        self.hash_key = key
+
+    def make_null_move(self):
+        # Pass the turn (for null-move pruning). No piece moves, so nothing is
+        # pushed and the attack cache stays valid; unmake_null_move flips back.
+        # If a search is abandoned inside the null move, taking back the real
+        # move before it restores the side and key anyway.
+        self.side ^= 1
+        self.hash_key ^= ZOBRIST_SIDE
+
+    def unmake_null_move(self):
+        self.side ^= 1
+        self.hash_key ^= ZOBRIST_SIDE
+
+    def unmake_move(self):
+        if self.attacks_ply == len(self.history):
+            self._revert_attacks()
+        (from_sq, to_sq, code, captured, promotion, self.unmoved, self.side,
+         self.hash_key, self.mg_score, self.eg_score, self.phase) = self.history.pop()
+        squares = self.squares
+        pieces = self.pieces
+        occupied = self.occupied
+        color = code // 6
+        from_bit = 1 << from_sq
+        to_bit = 1 << to_sq
+
+        pieces[squares[to_sq]] ^= to_bit
+        pieces[code] |= from_bit
+        occupied[color] ^= from_bit | to_bit
+        squares[from_sq] = code
+        squares[to_sq] = captured
+
+        if captured is not None:
+            pieces[captured] |= to_bit
+            occupied[color ^ 1] |= to_bit
+
+    def _pawn_targets(self, side, empty, enemy, captures_only):
+        # Pawns are generated set-wise: shift the whole pawn bitboard at once.
+        # Returns (targets, delta) pairs, each target's pawn being on
+        # to_sq + delta. With captures_only, just captures and promotions.
+        pawns = self.pieces[side * 6 + PAWN]
+        if side == WHITE_IDX:
+            single = (pawns >> 8) & empty
+            targets = ((single & ROW_BB[5]) >> 8) & empty
+            captures = (((pawns & ~FILE_A) >> 9) & enemy, 9), (((pawns & ~FILE_H) >> 7) & enemy, 7)
+            pushes = ((single & ROW_BB[0], 8),) if captures_only else ((single, 8), (targets, 16))
+        else:
+            single = (pawns << 8) & empty
+            targets = ((single & ROW_BB[2]) << 8) & empty
+            captures = (((pawns & ~FILE_A) << 7) & enemy, -7), (((pawns & ~FILE_H) << 9) & enemy, -9)
+            pushes = ((single & ROW_BB[7], -8),) if captures_only else ((single, -8), (targets, -16))
+        return captures + pushes
+
+    def generate_pseudo_moves(self, side, moves, captures_only=False):
+        # Appends packed moves to moves. With captures_only, just captures and
+        # promotions (for quiescence)
+        own = self.occupied[side]
+        enemy = self.occupied[side ^ 1]
+        occupied = own | enemy
+        empty = ~occupied & FULL_BB
+        allowed = enemy if captures_only else ~own
+        pieces = self.pieces
+        base = side * 6
+
+        for bb, delta in self._pawn_targets(side, empty, enemy, captures_only):
+            while bb:
+                lsb = bb & -bb
+                to_sq = lsb.bit_length() - 1
+                moves.append(to_sq + delta | to_sq << 6 | (MOVE_PROMOTION if lsb & PROMOTION_BB else 0))
+                bb ^= lsb
+
+        for piece_type, attack_fn in ((KNIGHT, None), (BISHOP, bishop_attacks), (ROOK, rook_attacks),
+                                      (QUEEN, queen_attacks), (KING, None)):
+            bb = pieces[base + piece_type]
+            while bb:
+                lsb = bb & -bb
+                from_sq = lsb.bit_length() - 1
+                bb ^= lsb
+                if piece_type == KNIGHT:
+                    targets = KNIGHT_ATTACKS[from_sq] & allowed
+                elif piece_type == KING:
+                    targets = KING_ATTACKS[from_sq] & allowed
                 else:
-                    break
-                    
-        return moves
-    
-    def get_knight_moves(self, row, col, piece):
-        moves = []
-        knight_moves = [
-            (2, 1), (2, -1), (-2, 1), (-2, -1),
-            (1, 2), (1, -2), (-1, 2), (-1, -2)
-        ]
-        
-        for dr, dc in knight_moves:
-            r, c = row + dr, col + dc
-            if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
-                target_piece = self.get_piece(r, c)
-                if target_piece is None or target_piece.color != piece.color:
-                    moves.append((r, c))
-                    
-        return moves
-    
-    def get_bishop_moves(self, row, col, piece):
+                    targets = attack_fn(from_sq, occupied) & allowed
+                while targets:
+                    lsb = targets & -targets
+                    moves.append(from_sq | (lsb.bit_length() - 1) << 6)
+                    targets ^= lsb
+
+    def _refresh_attacks(self):
+        occupied = self.occupied[WHITE_IDX] | self.occupied[BLACK_IDX]
+        self.square_attacks = [0 if code is None else piece_attacks(code, sq, occupied)
+                               for sq, code in enumerate(self.squares)]
+        self.attack_maps = [None, None]
+        self.attacks_ply = len(self.history)
+        self.attack_undo = []
+
+    def _sync_attacks(self):
+        ply = len(self.history)
+        if self.attacks_ply == ply:
+            return
+        if self.attacks_ply != ply - 1:
+            self._refresh_attacks()
+            return
+
+        # One move behind: only the moved piece and the sliders whose attacks
+        # reached its from or to square can have changed
+        from_sq, to_sq = self.history[-1][:2]
+        squares = self.squares
+        pieces = self.pieces
+        square_attacks = self.square_attacks
+        occupied = self.occupied[WHITE_IDX] | self.occupied[BLACK_IDX]
+        changes = [(from_sq, square_attacks[from_sq]), (to_sq, square_attacks[to_sq])]
+        touched = (1 << from_sq) | (1 << to_sq)
+        square_attacks[from_sq] = 0
+        square_attacks[to_sq] = piece_attacks(squares[to_sq], to_sq, occupied)
+        sliders = (pieces[1] | pieces[3] | pieces[4] | pieces[7] | pieces[9] | pieces[10]) & ~touched
+        while sliders:
+            lsb = sliders & -sliders
+            sq = lsb.bit_length() - 1
+            sliders ^= lsb
+            if square_attacks[sq] & touched:
+                changes.append((sq, square_attacks[sq]))
+                square_attacks[sq] = piece_attacks(squares[sq], sq, occupied)
+        self.attack_undo.append(changes)
+        self.attacks_ply = ply
+        self.attack_maps = [None, None]
+
+    def _revert_attacks(self):
+        # Called before the synced move is taken back
+        if not self.attack_undo:
+            self.attacks_ply = -1
+            return
+        square_attacks = self.square_attacks
+        for sq, attacks in reversed(self.attack_undo.pop()):
+            square_attacks[sq] = attacks
+        self.attacks_ply -= 1
+        self.attack_maps = [None, None]
+
+    def attack_map(self, side):
+        # Union of every square the pieces of side attack, from the cache
+        self._sync_attacks()
+        attacks = self.attack_maps[side]
+        if attacks is None:
+            attacks = 0
+            square_attacks = self.square_attacks
+            bb = self.occupied[side]
+            while bb:
+                lsb = bb & -bb
+                attacks |= square_attacks[lsb.bit_length() - 1]
+                bb ^= lsb
+            self.attack_maps[side] = attacks
+        return attacks
+
+    def is_square_attacked(self, sq, by_side, occupied=None):
+        # Look outward from sq: knight jumps, pawn diagonals, king adjacency,
+        # then the slider rays, stopping as soon as an attacker is found.
+        # occupied overrides the board's occupancy for the slider rays.
+        pieces = self.pieces
+        base = by_side * 6
+        if KNIGHT_ATTACKS[sq] & pieces[base + KNIGHT]:
+            return True
+        # A pawn of by_side attacks sq exactly when a pawn of the other color on
+        # sq would attack the pawn's square
+        if PAWN_ATTACKS[by_side ^ 1][sq] & pieces[base + PAWN]:
+            return True
+        if KING_ATTACKS[sq] & pieces[base + KING]:
+            return True
+        if occupied is None:
+            occupied = self.occupied[WHITE_IDX] | self.occupied[BLACK_IDX]
+        queens = pieces[base + QUEEN]
+        if bishop_attacks(sq, occupied) & (pieces[base + BISHOP] | queens):
+            return True
+        return bool(rook_attacks(sq, occupied) & (pieces[base + ROOK] | queens))
+
+    def side_in_check(self, side):
+        king = self.pieces[side * 6 + KING]
+        if not king:
+            return False
+        return self.is_square_attacked(king.bit_length() - 1, side ^ 1)
+
+    def legal_moves(self, side, captures_only=False):
+        # Returns (moves, in_check) with the moves as (from_sq, to_sq) pairs;
+        # no moves while in check is checkmate
         moves = []
-        directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-        
-        for dr, dc in directions:
-            for i in range(1, BOARD_SIZE):
-                r, c = row + i * dr, col + i * dc
-                if not (0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE):
-                    break
-                    
-                target_piece = self.get_piece(r, c)
-                if target_piece is None:
-                    moves.append((r, c))
-                elif target_piece.color != piece.color:
-                    moves.append((r, c))
-                    break
-                else:
-                    break
-                    
-        return moves
-    
-    def get_queen_moves(self, row, col, piece):
-        return self.get_rook_moves(row, col, piece) + self.get_bishop_moves(row, col, piece)
-    
-    def get_king_moves(self, row, col, piece):
+        in_check = self.packed_moves(side, moves, captures_only)
+        return [(move & 63, move >> 6 & 63) for move in moves], in_check
+
+    def packed_moves(self, side, moves, captures_only=False):
+        # Strictly legal moves, with no move played to test it: the checking
+        # pieces and the pinned pieces are found once from the king, and every
+        # move is masked by them. The moves are appended to moves packed as
+        # 16-bit ints (see encode_move), and the result is whether side is in
+        # check. With captures_only, just captures and promotions.
+        pieces = self.pieces
+        base = side * 6
+        enemy_base = (side ^ 1) * 6
+        king_bb = pieces[base + KING]
+        if not king_bb:
+            self.generate_pseudo_moves(side, moves, captures_only)
+            return False
+        king = king_bb.bit_length() - 1
+        own = self.occupied[side]
+        enemy = self.occupied[side ^ 1]
+        occupied = own | enemy
+        empty = ~occupied & FULL_BB
+        straight = pieces[enemy_base + ROOK] | pieces[enemy_base + QUEEN]
+        diagonal = pieces[enemy_base + BISHOP] | pieces[enemy_base + QUEEN]
+
+        # Walk the eight rays from the king. An enemy slider first on a ray
+        # gives check; one behind a single own piece pins it to that ray.
+        checkers = ((KNIGHT_ATTACKS[king] & pieces[enemy_base + KNIGHT])
+                    | (PAWN_ATTACKS[side][king] & pieces[enemy_base + PAWN]))
+        check_mask = checkers
+        pins = {}
+        for direction in range(8):
+            ray = RAYS[direction][king]
+            sliders = straight if direction < 4 else diagonal
+            if not ray & sliders:
+                continue
+            blockers = ray & occupied
+            if RAY_POSITIVE[direction]:
+                first = blockers & -blockers
+            else:
+                first = 1 << (blockers.bit_length() - 1)
+            first_sq = first.bit_length() - 1
+            if first & sliders:
+                checkers |= first
+                check_mask |= ray & ~RAYS[direction][first_sq]
+                continue
+            if not first & own:
+                continue
+            rest = blockers ^ first
+            if not rest:
+                continue
+            if RAY_POSITIVE[direction]:
+                second = rest & -rest
+            else:
+                second = 1 << (rest.bit_length() - 1)
+            if second & sliders:
+                pins[first_sq] = ray & ~RAYS[direction][second.bit_length() - 1]
+        in_check = bool(checkers)
+        if not in_check:
+            check_mask = FULL_BB
+
+        allowed = enemy if captures_only else ~own & FULL_BB
+        # Two checkers: only the king can move
+        if checkers & (checkers - 1) == 0:
+            mask = allowed & check_mask
+            for bb, delta in self._pawn_targets(side, empty, enemy, captures_only):
+                bb &= check_mask
+                while bb:
+                    lsb = bb & -bb
+                    to_sq = lsb.bit_length() - 1
+                    bb ^= lsb
+                    from_sq = to_sq + delta
+                    if from_sq in pins and not pins[from_sq] & lsb:
+                        continue
+                    moves.append(from_sq | to_sq << 6 | (MOVE_PROMOTION if lsb & PROMOTION_BB else 0))
+
+            for piece_type, attack_fn in ((KNIGHT, None), (BISHOP, bishop_attacks), (ROOK, rook_attacks),
+                                          (QUEEN, queen_attacks)):
+                bb = pieces[base + piece_type]
+                while bb:
+                    lsb = bb & -bb
+                    from_sq = lsb.bit_length() - 1
+                    bb ^= lsb
+                    if piece_type == KNIGHT:
+                        targets = KNIGHT_ATTACKS[from_sq] & mask
+                    else:
+                        targets = attack_fn(from_sq, occupied) & mask
+                    if from_sq in pins:
+                        targets &= pins[from_sq]
+                    while targets:
+                        lsb = targets & -targets
+                        moves.append(from_sq | (lsb.bit_length() - 1) << 6)
+                        targets ^= lsb
+
+        # The king can't step onto an attacked square; it is taken off the
+        # board for the test so it can't hide behind itself from a slider
+        targets = KING_ATTACKS[king] & allowed
+        without_king = occupied ^ king_bb
+        while targets:
+            lsb = targets & -targets
+            to_sq = lsb.bit_length() - 1
+            targets ^= lsb
+            if not self.is_square_attacked(to_sq, side ^ 1, without_king):
+                moves.append(king | to_sq << 6)
+        return in_check
+
+    def generate_legal_moves(self, side, captures_only=False):
+        return self.legal_moves(side, captures_only)[0]
+
+    def copy(self):
+        # Independent copy of the position, e.g. for a search in another thread
+        other = ChessBoard.__new__(ChessBoard)
+        other.__dict__.update(self.__dict__)
+        other.pieces = self.pieces[:]
+        other.occupied = self.occupied[:]
+        other.squares = self.squares[:]
+        other.history = self.history[:]
+        other.valid_moves = self.valid_moves[:]
+        other.square_attacks = self.square_attacks[:]
+        other.attack_maps = self.attack_maps[:]
+        other.attack_undo = self.attack_undo[:]
+        # Not shared: the copy may be searched in another thread
+        other.move_cache = {}
+        return other
+
+    def packed_history(self):
+        # The moves played on this board, packed, e.g. for GameArchive.append
+        return [encode_move(from_sq, to_sq, MOVE_PROMOTION if promotion else 0)
+                for from_sq, to_sq, _, _, promotion, *_ in self.history]
+
+    def perft(self, depth):
+        # Count the leaf nodes of the legal move tree to the given depth
+        if depth == 0:
+            return 1
         moves = []
-        king_moves = [
-            (1, 0), (-1, 0), (0, 1), (0, -1),
-            (1, 1), (1, -1), (-1, 1), (-1, -1)
-        ]
-        
-        for dr, dc in king_moves:
-            r, c = row + dr, col + dc
-            if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
-                target_piece = self.get_piece(r, c)
-                if target_piece is None or target_piece.color != piece.color:
-                    moves.append((r, c))
-                    
-        return moves
-    
+        self.packed_moves(self.side, moves)
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            self.make_move(move & 63, move >> 6 & 63)
+            nodes += self.perft(depth - 1)
+            self.unmake_move()
+        return nodes
+
+    def rules_moves(self, side):
+        # Legal moves of side for the rules layer, shared by piece selection,
+        # move validation and the check and checkmate tests, so one human move
+        # generates them once: (targets by from square, in_check). Kept in a
+        # small LRU cache keyed by position; a move changes the Zobrist key, so
+        # entries never go stale and nothing has to be dropped on a move.
+        key = (self.hash_key, side)
+        cache = self.move_cache
+        entry = cache.pop(key, None)
+        if entry is None:
+            moves, in_check = self.legal_moves(side)
+            targets = {}
+            for from_sq, to_sq in moves:
+                targets.setdefault(from_sq, []).append(divmod(to_sq, BOARD_SIZE))
+            entry = (targets, in_check)
+            if len(cache) >= MOVE_CACHE_SIZE:
+                del cache[next(iter(cache))]
+        cache[key] = entry
+        return entry
+
+    def get_valid_moves(self, row, col):
+        sq = row * BOARD_SIZE + col
+        if self.squares[sq] is None:
+            return []
+
+        # Only moves that don't put or leave the king in check
+        return list(self.rules_moves(self.squares[sq] // 6)[0].get(sq, ()))
+
     def would_be_in_check(self, from_row, from_col, to_row, to_col, color):
-        temp_board = copy.deepcopy(self.board)
-        
-        temp_board[to_row][to_col] = temp_board[from_row][from_col]
-        temp_board[from_row][from_col] = None
-        
-        king_pos = None
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                piece = temp_board[r][c]
-                if piece and piece.piece_type == PieceType.KING and piece.color == color:
-                    king_pos = (r, c)
-                    break
-            if king_pos:
-                break
-                
-        if not king_pos:
+        if self.squares[from_row * BOARD_SIZE + from_col] is None:
             return False
-            
-        opponent_color = PieceColor.BLACK if color == PieceColor.WHITE else PieceColor.WHITE
-        
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                piece = temp_board[r][c]
-                if piece and piece.color == opponent_color:
-                    if king_pos in self.get_valid_moves_simulated(r, c, piece, temp_board):
-                        return True
-        return False
+        self.make_move(from_row * BOARD_SIZE + from_col, to_row * BOARD_SIZE + to_col)
+        in_check = self.side_in_check(COLOR_INDEX[color])
+        self.unmake_move()
+        return in_check
 
-    def get_valid_moves_simulated(self, row, col, piece, board):
-        if piece.piece_type == PieceType.PAWN:
-            return self.get_pawn_moves_simulated(row, col, piece, board)
-        elif piece.piece_type == PieceType.ROOK:
-            return self.get_rook_moves_simulated(row, col, piece, board)
-        elif piece.piece_type == PieceType.KNIGHT:
-            return self.get_knight_moves_simulated(row, col, piece, board)
-        elif piece.piece_type == PieceType.BISHOP:
-            return self.get_bishop_moves_simulated(row, col, piece, board)
-        elif piece.piece_type == PieceType.QUEEN:
-            return self.get_queen_moves_simulated(row, col, piece, board)
-        elif piece.piece_type == PieceType.KING:
-            return self.get_king_moves_simulated(row, col, piece, board)
-        return []
-    
-    def get_pawn_moves_simulated(self, row, col, piece, board):
-        moves = []
-        direction = -1 if piece.color == PieceColor.WHITE else 1
-        
-        if self.get_piece_simulated(row + direction, col, board) is None:
-            moves.append((row + direction, col))
-            if not piece.has_moved and self.get_piece_simulated(row + 2 * direction, col, board) is None:
-                moves.append((row + 2 * direction, col))
-        
-        for offset in [-1, 1]:
-            target_piece = self.get_piece_simulated(row + direction, col + offset, board)
-            if target_piece and target_piece.color != piece.color:
-                moves.append((row + direction, col + offset))
-        return moves
-    
-    def get_rook_moves_simulated(self, row, col, piece, board):
-        moves = []
-        directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
-        for dr, dc in directions:
-            for i in range(1, BOARD_SIZE):
-                r, c = row + i * dr, col + i * dc
-                if not (0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE):
-                    break
-                target_piece = self.get_piece_simulated(r, c, board)
-                if target_piece is None:
-                    moves.append((r, c))
-                elif target_piece.color != piece.color:
-                    moves.append((r, c))
-                    break
-                else:
-                    break
-        return moves
-    
-    def get_knight_moves_simulated(self, row, col, piece, board):
-        moves = []
-        knight_moves = [
-            (2, 1), (2, -1), (-2, 1), (-2, -1),
-            (1, 2), (1, -2), (-1, 2), (-1, -2)
-        ]
-        for dr, dc in knight_moves:
-            r, c = row + dr, col + dc
-            if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
-                target_piece = self.get_piece_simulated(r, c, board)
-                if target_piece is None or target_piece.color != piece.color:
-                    moves.append((r, c))
-        return moves
-    
-    def get_bishop_moves_simulated(self, row, col, piece, board):
-        moves = []
-        directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-        for dr, dc in directions:
-            for i in range(1, BOARD_SIZE):
-                r, c = row + i * dr, col + i * dc
-                if not (0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE):
-                    break
-                target_piece = self.get_piece_simulated(r, c, board)
-                if target_piece is None:
-                    moves.append((r, c))
-                elif target_piece.color != piece.color:
-                    moves.append((r, c))
-                    break
-                else:
-                    break
-        return moves
-    
-    def get_queen_moves_simulated(self, row, col, piece, board):
-        return self.get_rook_moves_simulated(row, col, piece, board) + self.get_bishop_moves_simulated(row, col, piece, board)
-    
-    def get_king_moves_simulated(self, row, col, piece, board):
-        moves = []
-        king_moves = [
-            (1, 0), (-1, 0), (0, 1), (0, -1),
-            (1, 1), (1, -1), (-1, 1), (-1, -1)
-        ]
-        for dr, dc in king_moves:
-            r, c = row + dr, col + dc
-            if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
-                target_piece = self.get_piece_simulated(r, c, board)
-                if target_piece is None or target_piece.color != piece.color:
-                    moves.append((r, c))
-        return moves
-    
-    def get_piece_simulated(self, row, col, board):
-        if 0 <= row < BOARD_SIZE and 0 <= col < BOARD_SIZE:
-            return board[row][col]
-        return None
-    
     def is_checkmate(self, color):
-        if not self.is_in_check(color):
-            return False
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                piece = self.get_piece(r, c)
-                if piece and piece.color == color:
-                    if self.get_valid_moves(r, c):
-                        return False
-        return True
-    
+        # Both answers come out of the legal move generator
+        targets, in_check = self.rules_moves(COLOR_INDEX[color])
+        return in_check and not targets
+
     def is_in_check(self, color):
-        king_pos = None
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                piece = self.get_piece(r, c)
-                if piece and piece.piece_type == PieceType.KING and piece.color == color:
-                    king_pos = (r, c)
-                    break
-            if king_pos:
+        # The cached attack map is exact for the position on the board, so the
+        # UI check test is a single mask once it has been built
+        side = COLOR_INDEX[color]
+        return bool(self.pieces[side * 6 + KING] & self.attack_map(side ^ 1))
+
+# Mate scores count down with the distance from the root, so shorter mates win
+MATE_SCORE = 100000
+MATE_BOUND = MATE_SCORE - 1000
+
+# Transposition table bound types
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2
+TT_ENTRY_BYTES = 16
+_TT_SCORE_OFFSET = 1 << 20
+
+MAX_DEPTH = 64
+# The clock is read every 256 nodes: ~13 ms at the ~20k nodes/s of a match
+# worker, small next to the short move times tournament.py plays at
+TIME_CHECK_MASK = 255
+
+# Move ordering keys: principal variation and hash moves, then captures by
+# most valuable victim / least valuable attacker, then killers, then quiet
+# moves by their history score (kept below KILLER_SCORE)
+PV_MOVE_SCORE = 3000000
+HASH_MOVE_SCORE = 2000000
+CAPTURE_SCORE = 1000000
+KILLER_SCORE = 900000
+# The attacker only breaks ties between equal victims: it counts by its rank
+# (pawn 0 up to king 5), so even a king capture sorts by what it takes
+ATTACKER_RANK = sorted(range(6), key=lambda piece_type: PIECE_VALUES[piece_type])
+MVV_LVA = [[PIECE_VALUES[victim] * 10 - ATTACKER_RANK.index(attacker) for attacker in range(6)]
+           for victim in range(6)]
+
+# Quiescence search: a capture is skipped when even winning the piece plus
+# DELTA_MARGIN can't lift the score to alpha, and each leaf of the main
+# search may spend at most QUIESCENCE_NODE_LIMIT nodes resolving captures
+DELTA_MARGIN = 200
+QUIESCENCE_NODE_LIMIT = 2000
+
+# Null-move pruning: from NULL_MOVE_MIN_DEPTH on, the side to move passes and
+# the opponent gets a search NULL_MOVE_REDUCTION plies shallower (one more
+# from NULL_MOVE_DEEP_DEPTH); if that still fails high the node is cut
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_DEEP_DEPTH = 7
+
+# Late move reductions: quiet moves after the first LMR_FULL_MOVES are
+# searched a ply shallower (two from LMR_DEEP_MOVES on) and only searched
+# again at full depth if they beat alpha
+LMR_MIN_DEPTH = 3
+LMR_FULL_MOVES = 3
+LMR_DEEP_MOVES = 8
+
+class SearchTimeout(Exception):
+    pass
+
+def encode_move(from_sq, to_sq, flags=0):
+    return from_sq | (to_sq << 6) | flags
+
+def decode_move(move):
+    return move & 63, move >> 6 & 63
+
+def move_to_rowcol(move):
+    # (from_sq, to_sq) -> (from_row, from_col, to_row, to_col)
+    return divmod(move[0], BOARD_SIZE) + divmod(move[1], BOARD_SIZE)
+
+def square_name(sq):
+    row, col = divmod(sq, BOARD_SIZE)
+    return "abcdefgh"[col] + str(8 - row)
+
+def parse_square(name):
+    return (8 - int(name[1])) * BOARD_SIZE + "abcdefgh".index(name[0])
+
+def move_name(board, from_sq, to_sq):
+    # Long algebraic (UCI) name of a move on board, e.g. e2e4 or e7e8q
+    name = square_name(from_sq) + square_name(to_sq)
+    if board.squares[from_sq] % 6 == PAWN and (to_sq < 8 or to_sq >= 56):
+        name += 'q'
+    return name
+
+def score_to_tt(score, ply):
+    # Mate scores are stored relative to the node, not the root
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+class TranspositionTable:
+    # Fixed-size hash table of search results in two flat arrays of 64-bit
+    # words: the Zobrist key and the packed depth, bound, generation, move and
+    # score. Each bucket has two slots. Slot 0 keeps the deepest result and is
+    # only replaced by an equal or deeper search, or once its entry is from an
+    # older search; slot 1 always takes the newest result.
+    # The key word is stored XORed with the data word, so an entry torn by two
+    # processes writing the same slot of a shared table just fails to match.
+    def __init__(self, size_mb=16, buffer=None, clear=True):
+        # clear=False attaches to a shared buffer another process already
+        # filled, keeping its entries
+        self.size_mb = size_mb
+        self.buckets = max(1, int(size_mb * 1024 * 1024) // (2 * TT_ENTRY_BYTES))
+        self.generation = 0
+        self.buffer = buffer
+        if clear or buffer is None:
+            self.clear()
+        else:
+            self.attach()
+
+    @staticmethod
+    def buffer_size(size_mb):
+        return max(1, int(size_mb * 1024 * 1024) // (2 * TT_ENTRY_BYTES)) * 2 * TT_ENTRY_BYTES
+
+    def clear(self):
+        if self.buffer is None:
+            self.keys = array('Q', bytes(16 * self.buckets))
+            self.data = array('Q', bytes(16 * self.buckets))
+        else:
+            memoryview(self.buffer)[:32 * self.buckets] = bytes(32 * self.buckets)
+            self.attach()
+
+    def attach(self):
+        # Lay the table over the shared memory buffer
+        size = 16 * self.buckets
+        raw = memoryview(self.buffer)[:2 * size]
+        self.keys = raw[:size].cast('Q')
+        self.data = raw[size:].cast('Q')
+
+    def new_search(self):
+        self.generation = (self.generation + 1) & 0xFF
+
+    def generation_counts(self):
+        # {generation: stored entries}, to check which searches filled the table
+        counts = {}
+        for data in self.data:
+            if data:
+                generation = data >> 10 & 0xFF
+                counts[generation] = counts.get(generation, 0) + 1
+        return counts
+
+    def probe(self, key):
+        # Returns (depth, bound, score, move) or None
+        index = (key % self.buckets) * 2
+        keys = self.keys
+        data = self.data[index]
+        if keys[index] ^ data != key:
+            index += 1
+            data = self.data[index]
+            if keys[index] ^ data != key:
+                return None
+        return (data & 0xFF, data >> 8 & 3, (data >> 34) - _TT_SCORE_OFFSET, data >> 18 & 0xFFFF)
+
+    def store(self, key, depth, bound, score, move):
+        index = (key % self.buckets) * 2
+        data = (depth | (bound << 8) | (self.generation << 10) | ((move or 0) << 18)
+                | ((score + _TT_SCORE_OFFSET) << 34))
+        old = self.data[index]
+        if (self.keys[index] ^ old == key or depth >= (old & 0xFF)
+                or (old >> 10 & 0xFF) != self.generation):
+            self.keys[index] = key ^ data
+            self.data[index] = data
+        else:
+            self.keys[index + 1] = key ^ data
+            self.data[index + 1] = data
+
+# Opening book file: a 16-byte header (magic and entry count) followed by
+# entries of Zobrist key, packed move and weight, sorted by key
+BOOK_MAGIC = b'CHBOOK1\0'
+BOOK_HEADER = struct.Struct('<8sII')
+BOOK_ENTRY = struct.Struct('<QHH')
+
+class OpeningBook:
+    # Read-only view of a book file through mmap: lookups are binary searches
+    # straight over the mapped file, so opening a book costs the same however
+    # large it is and nothing is copied into Python objects up front
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < BOOK_HEADER.size:
+            self.mm.close()
+            raise ValueError(f"Not an opening book: {path}")
+        magic, self.count, _ = BOOK_HEADER.unpack_from(self.mm, 0)
+        if magic != BOOK_MAGIC or len(self.mm) < BOOK_HEADER.size + self.count * BOOK_ENTRY.size:
+            self.mm.close()
+            raise ValueError(f"Not an opening book: {path}")
+
+    def _entry(self, index):
+        return BOOK_ENTRY.unpack_from(self.mm, BOOK_HEADER.size + index * BOOK_ENTRY.size)
+
+    def lookup(self, key):
+        # All (move, weight) pairs stored for the position
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        moves = []
+        while lo < self.count:
+            entry_key, move, weight = self._entry(lo)
+            if entry_key != key:
                 break
-        if not king_pos:
-            return False
-        opponent_color = PieceColor.BLACK if color == PieceColor.WHITE else PieceColor.WHITE
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                piece = self.get_piece(r, c)
-                if piece and piece.color == opponent_color:
-                    if king_pos in self.get_valid_moves(r, c):
-                        return True
-        return False
+            moves.append((move, weight))
+            lo += 1
+        return moves
+
+    def choose_move(self, key, rng=random):
+        # Pick a book move at random, in proportion to its weight
+        moves = [(move, weight) for move, weight in self.lookup(key) if weight > 0]
+        if not moves:
+            return None
+        return rng.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+
+    def close(self):
+        self.mm.close()
+
+    @staticmethod
+    def write(path, weights):
+        # weights: {(key, move): weight}; writes a book file. It is written
+        # aside and renamed over the old one, so a game that has the old book
+        # mapped keeps reading it and an interrupted write leaves it intact.
+        entries = sorted((key, move, min(weight, 0xFFFF)) for (key, move), weight in weights.items())
+        temp_path = f"{path}.{os.getpid()}"
+        with open(temp_path, 'wb') as f:
+            f.write(BOOK_HEADER.pack(BOOK_MAGIC, len(entries), 0))
+            for entry in entries:
+                f.write(BOOK_ENTRY.pack(*entry))
+        os.replace(temp_path, path)
+
+# Game archive: finished games appended one after another. Each record is a
+# header (move count, result for White as 1, 0 or -1, FEN length), the start
+# FEN (empty for the initial position) and the moves as packed 16-bit ints,
+# so a game costs two bytes a ply
+ARCHIVE_MAGIC = b'CHGAMES1'
+ARCHIVE_RECORD = struct.Struct('<HbB')
+
+class GameArchive:
+    # Read-only view of an archive through mmap, like OpeningBook. Opening it
+    # only hops over the record headers; a game's moves are read when asked
+    # for. Games are added with GameArchive.append.
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+            self.mm.close()
+            raise ValueError(f"Not a game archive: {path}")
+        self.offsets = []
+        offset = len(ARCHIVE_MAGIC)
+        while offset + ARCHIVE_RECORD.size <= len(self.mm):
+            count, _, fen_length = ARCHIVE_RECORD.unpack_from(self.mm, offset)
+            end = offset + ARCHIVE_RECORD.size + fen_length + 2 * count
+            # A record cut short by an interrupted append is left out
+            if end > len(self.mm):
+                break
+            self.offsets.append(offset)
+            offset = end
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def game(self, index):
+        # (start FEN, result for White, packed moves as an array('H'))
+        offset = self.offsets[index]
+        count, result, fen_length = ARCHIVE_RECORD.unpack_from(self.mm, offset)
+        start = offset + ARCHIVE_RECORD.size
+        fen = self.mm[start:start + fen_length].decode() or START_FEN
+        moves = array('H')
+        moves.frombytes(self.mm[start + fen_length:start + fen_length + 2 * count])
+        if sys.byteorder == 'big':
+            moves.byteswap()
+        return fen, result, moves
+
+    def replay(self, index):
+        # Yields the board at the start and after each move (the same board
+        # object, played forward)
+        fen, _, moves = self.game(index)
+        board = ChessBoard(fen)
+        yield board
+        for move in moves:
+            board.make_move(move & 63, move >> 6 & 63)
+            yield board
+
+    def close(self):
+        self.mm.close()
+
+    @staticmethod
+    def append(path, moves, result=0, fen=START_FEN):
+        # Adds one game: its packed moves from fen and the result for White
+        record = array('H', moves)
+        if sys.byteorder == 'big':
+            record.byteswap()
+        fen_bytes = b'' if fen == START_FEN else fen.encode()
+        with open(path, 'ab') as f:
+            if f.tell() == 0:
+                f.write(ARCHIVE_MAGIC)
+            f.write(ARCHIVE_RECORD.pack(len(record), result, len(fen_bytes)))
+            f.write(fen_bytes)
+            f.write(record.tobytes())
+
+# Endgame tablebases: one file per material balance (e.g. KRvK.tb), written
+# by tablebase_gen.py. After the magic, each position is one byte: 0 for a
+# draw, otherwise the distance to mate in plies plus one, so an odd distance is
+# a win for the side to move and an even one a loss.
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebases')
+TB_MAGIC = b'CHTB1\0\0\0'
+TB_MAX_PIECES = 4
+TB_ILLEGAL = 255
+# Piece order inside a table name and a position's piece list
+TB_LETTERS = 'PRNBQK'
+TB_ORDER = (KING, QUEEN, ROOK, BISHOP, KNIGHT, PAWN)
+TB_RANK = [TB_ORDER.index(piece_type) for piece_type in range(6)]
+# Positions are mirrored so the white king is on files a-d, and without pawns
+# also on ranks 1-4 on or below the a1-h8 diagonal (10 squares)
+TB_KING_SQUARES = (
+    [sq for sq in range(64) if sq % 8 < 4],
+    [sq for sq in range(32, 64) if 7 - sq // 8 <= sq % 8 < 4],
+)
+TB_KING_SLOTS = [{sq: slot for slot, sq in enumerate(squares)} for squares in TB_KING_SQUARES]
+TB_TRANSPOSE = [(7 - sq % 8) * 8 + 7 - sq // 8 for sq in range(64)]
+
+def tablebase_name(codes):
+    # Material name of a sorted piece list, e.g. KQvK, and whether the colors
+    # must be swapped because the tables only store the stronger side as White
+    sides = [''.join(TB_LETTERS[code % 6] for code in codes if code // 6 == color) for color in (0, 1)]
+    strength = [(sum(PIECE_VALUES[TB_LETTERS.index(letter)] for letter in side[1:]), side) for side in sides]
+    if strength[1] > strength[0]:
+        return sides[1] + 'v' + sides[0], True
+    return sides[0] + 'v' + sides[1], False
+
+def tablebase_size(name):
+    return 2 * len(TB_KING_SQUARES['P' not in name]) * 64 ** (len(name) - 2)
+
+def tablebase_index(squares, side, pawnless):
+    # Index of a position in its table; squares follow the table's piece order
+    # (white king first)
+    king = squares[0]
+    if king % 8 > 3:
+        squares = [sq ^ 7 for sq in squares]
+        king ^= 7
+    if pawnless:
+        if king < 32:
+            squares = [sq ^ 56 for sq in squares]
+            king ^= 56
+        if 7 - king // 8 > king % 8:
+            squares = [TB_TRANSPOSE[sq] for sq in squares]
+            king = TB_TRANSPOSE[king]
+        elif 7 - king // 8 == king % 8:
+            # On the diagonal the transposed position is stored as well, so
+            # pick one of the two by the other pieces' squares
+            transposed = [TB_TRANSPOSE[sq] for sq in squares]
+            if transposed[1:] < squares[1:]:
+                squares = transposed
+    index = side * len(TB_KING_SQUARES[pawnless]) + TB_KING_SLOTS[pawnless][king]
+    for sq in squares[1:]:
+        index = index * 64 + sq
+    return index
+
+class Tablebase:
+    # Read-only endgame tables in a directory, each mmapped the first time a
+    # position with its material is probed
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+        names = [entry[:-3] for entry in os.listdir(directory) if entry.endswith('.tb')]
+        self.max_pieces = max((len(name) - 1 for name in names), default=0)
+
+    def _table(self, name):
+        if name not in self.tables:
+            path = os.path.join(self.directory, name + '.tb')
+            table = None
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if table[:len(TB_MAGIC)] != TB_MAGIC or len(table) != len(TB_MAGIC) + tablebase_size(name):
+                    table.close()
+                    raise ValueError(f"Not a tablebase: {path}")
+            self.tables[name] = table
+        return self.tables[name]
+
+    def probe_pieces(self, pieces, side):
+        # pieces: (code, sq) pairs. Returns (wdl, plies) for the side to move:
+        # wdl is 1, 0 or -1, plies the distance to mate. None without a table.
+        if len(pieces) == 2:
+            return 0, 0
+        pieces = sorted(pieces, key=lambda piece: (piece[0] // 6, TB_RANK[piece[0] % 6]))
+        name, flip = tablebase_name([code for code, _ in pieces])
+        if flip:
+            pieces = sorted(((code + 6 if code < 6 else code - 6, sq ^ 56) for code, sq in pieces),
+                            key=lambda piece: (piece[0] // 6, TB_RANK[piece[0] % 6]))
+            side ^= 1
+        table = self._table(name)
+        if table is None:
+            return None
+        index = tablebase_index([sq for _, sq in pieces], side, 'P' not in name)
+        value = table[len(TB_MAGIC) + index]
+        if value == 0:
+            return 0, 0
+        if value == TB_ILLEGAL:
+            return None
+        plies = value - 1
+        return (1 if plies % 2 else -1), plies
+
+    def probe(self, board):
+        occupied = board.occupied[WHITE_IDX] | board.occupied[BLACK_IDX]
+        if occupied.bit_count() > self.max_pieces:
+            return None
+        pieces = [(code, sq) for code in range(12) for sq in bb_squares(board.pieces[code])]
+        return self.probe_pieces(pieces, board.side)
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables = {}
+
+# Search statistics are logged here as one JSON object per move; headless
+# tools turn them on with logging.basicConfig(level=logging.INFO)
+SEARCH_LOG = logging.getLogger('chess.search')
+
+class SearchStats:
+    # Opt-in numbers about a search (ChessAI(..., stats=True)). The node and
+    # cutoff counters are kept on the AI anyway and copied in once the search
+    # ends (each iteration only records its depth, time and node count in
+    # iterations); only the table probe counts are added inside the search,
+    # so an AI without stats pays one None check per node.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.beta_cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.null_move_cutoffs = 0
+        self.reductions = 0
+        self.re_searches = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.time = 0.0
+        # (depth, seconds, nodes) for each completed iteration, cumulative
+        self.iterations = []
+
+    def update(self, ai, elapsed):
+        self.nodes = ai.nodes
+        self.quiescence_nodes = ai.qnodes
+        self.beta_cutoffs = ai.beta_cutoffs
+        self.first_move_cutoffs = ai.first_move_cutoffs
+        self.null_move_cutoffs = ai.null_move_cutoffs
+        self.reductions = ai.reductions
+        self.re_searches = ai.re_searches
+        self.time = elapsed
+
+    @property
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.beta_cutoffs if self.beta_cutoffs else 0.0
+
+    @property
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.time if self.time else 0.0
+
+    def as_dict(self):
+        return {
+            'nodes': self.nodes,
+            'quiescence_nodes': self.quiescence_nodes,
+            'beta_cutoffs': self.beta_cutoffs,
+            'first_move_cutoff_rate': round(self.first_move_cutoff_rate, 4),
+            'null_move_cutoffs': self.null_move_cutoffs,
+            'reductions': self.reductions,
+            're_searches': self.re_searches,
+            'tt_probes': self.tt_probes,
+            'tt_hits': self.tt_hits,
+            'tt_hit_rate': round(self.tt_hit_rate, 4),
+            'time': round(self.time, 4),
+            'nodes_per_second': round(self.nodes_per_second),
+            'iterations': [{'depth': depth, 'time': round(seconds, 4), 'nodes': nodes}
+                           for depth, seconds, nodes in self.iterations],
+        }
+
+    def summary(self):
+        # One line for the status bar
+        depth = self.iterations[-1][0] if self.iterations else 0
+        return (f"d{depth} {self.nodes / 1000:.0f}k nodes {self.nodes_per_second / 1000:.0f}k/s "
+                f"TT {self.tt_hit_rate:.0%} 1st {self.first_move_cutoff_rate:.0%}")
+
+class _SearchExpired:
+    # Stop event of one helper search: set once the main process has moved on
+    # to another search id, so a stop can't be missed between searches
+    def __init__(self, current_search, search_id):
+        self.current_search = current_search
+        self.search_id = search_id
+
+    def is_set(self):
+        return self.current_search.value != self.search_id
+
+def _smp_helper(shm_name, tt_size_mb, color, tasks, current_search, helper_id, tablebase_dir):
+    # Lazy SMP helper process: searches each position it is sent, sharing the
+    # transposition table with the main search, until current_search no
+    # longer holds the task's search id. Only the table entries it leaves
+    # behind are used.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ai = ChessAI(ChessBoard(), color, tt_size_mb=0, tablebase_dir=tablebase_dir)
+    ai.tt = TranspositionTable(tt_size_mb, buffer=shm.buf, clear=False)
+    # The main search starts each search's generation; helpers stamp their
+    # entries with the same one
+    ai.owns_table = False
+    ai.depth = MAX_DEPTH
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        search_id, ai.board, ai.tt.generation = task
+        ai.stop_event = _SearchExpired(current_search, search_id)
+        # Tasks of searches that ended while queued are skipped
+        if ai.stop_event.is_set():
+            continue
+        # Odd helpers start one ply deeper so the workers spread over depths
+        ai.get_move(start_depth=1 + helper_id % 2)
+    ai.tt = None
+    shm.close()
 
 class ChessAI:
-    def __init__(self, board, color):
+    def __init__(self, board, color, tt_size_mb=16, workers=1, book_path=None, tablebase_dir=None, stats=False):
         self.board = board
         self.color = color
+        # The search works with the integer side, not the PieceColor
+        self.side = COLOR_INDEX[color]
         self.depth = 2
-        
-    def get_move(self):
-        _, move = self.minimax(self.depth, -float('inf'), float('inf'), True)
-        if move is None:
+        # Statistics of the last search, or None when not collected
+        self.stats = SearchStats() if stats else None
+        # Positions found in the opening book are answered without a search
+        self.book = OpeningBook(book_path) if book_path else None
+        self.book_rng = random.Random()
+        # Endings covered by the tablebases are looked up instead of evaluated
+        self.tablebase_dir = tablebase_dir
+        self.tablebase = Tablebase(tablebase_dir) if tablebase_dir else None
+        # With more than one worker, helper processes search alongside this
+        # one (Lazy SMP) and the table lives in shared memory
+        self.workers = max(1, workers)
+        self.shm = None
+        self.helpers = []
+        self.helper_tasks = []
+        # Id of the running helper search; changing it stops the helpers
+        self.helper_search = None
+        if self.workers > 1:
+            self.shm = shared_memory.SharedMemory(create=True, size=TranspositionTable.buffer_size(tt_size_mb))
+            self.tt = TranspositionTable(tt_size_mb, buffer=self.shm.buf)
+        else:
+            # Kept for the whole game so each move reuses the earlier searches
+            self.tt = TranspositionTable(tt_size_mb)
+        # False in SMP helpers, which share the main search's table generation
+        self.owns_table = True
+        self.deadline = None
+        self.search_start = 0.0
+        # Move budget given by ponder_hit, counted from the search start
+        self.ponder_budget_ms = None
+        self.stop_event = None
+        self.nodes = 0
+        self.current_depth = 0
+        self.completed_depth = 0
+        self.last_score = 0
+        self.pv = []
+        self.pv_moves = {}
+        # Called with the AI after each completed iteration (e.g. to report
+        # progress to a UCI front end)
+        self.on_iteration = None
+        # Move ordering state: two killer moves per ply and a history score per
+        # piece code and destination square
+        self.move_ordering = True
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+        self.history_scores = [[0] * 64 for _ in range(12)]
+        self.beta_cutoffs = 0
+        self.first_move_cutoffs = 0
+        # Pruning switches, so each technique's gain can be measured (e.g. with
+        # tournament.py --engine-a "use_null_move=False")
+        self.use_pvs = True
+        self.use_null_move = True
+        self.use_lmr = True
+        self.null_move_cutoffs = 0
+        self.reductions = 0
+        self.re_searches = 0
+        self.use_quiescence = True
+        self.quiescence_node_limit = QUIESCENCE_NODE_LIMIT
+        self.qnodes = 0
+        self.q_budget = 0
+
+    def start_helpers(self):
+        context = multiprocessing.get_context('spawn')
+        self.helper_search = context.Value('q', 0)
+        for helper_id in range(1, self.workers):
+            tasks = context.Queue()
+            helper = context.Process(target=_smp_helper, daemon=True,
+                                     args=(self.shm.name, self.tt.size_mb, self.color, tasks,
+                                           self.helper_search, helper_id, self.tablebase_dir))
+            helper.start()
+            self.helpers.append(helper)
+            self.helper_tasks.append(tasks)
+
+    def close(self):
+        # Shut down the helper processes and release the shared table, book
+        # and tablebases
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+        if self.tablebase is not None:
+            self.tablebase.close()
+            self.tablebase = None
+        for tasks in self.helper_tasks:
+            tasks.put(None)
+        if self.helper_search is not None:
+            self.helper_search.value += 1
+        for helper in self.helpers:
+            helper.join(timeout=5)
+        self.helpers = []
+        self.helper_tasks = []
+        if self.shm is not None:
+            self.tt = TranspositionTable(0)
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def get_move(self, time_budget_ms=None, start_depth=1, ponder=False):
+        # Iterative deepening: search one ply deeper at a time. Without a time
+        # budget it stops at self.depth; with one it keeps going until the
+        # budget runs out and returns the move of the last completed iteration.
+        # With ponder, it searches on the opponent's time: no book or
+        # tablebase move, and time_budget_ms only caps how long it ponders
+        # until ponder_hit gives it the move's budget.
+        if self.stats is not None:
+            self.stats.reset()
+        if not ponder:
+            book_move = self.get_book_move()
+            if book_move is not None:
+                return book_move
+            tablebase_move = self.get_tablebase_move()
+            if tablebase_move is not None:
+                return tablebase_move
+        max_depth = MAX_DEPTH if ponder or time_budget_ms is not None else self.depth
+
+        if self.owns_table:
+            self.tt.new_search()
+        if self.workers > 1:
+            if not self.helpers:
+                self.start_helpers()
+            # Each search gets its own id, and bumping it again at the end
+            # stops the helpers even if they only check after the next search
+            # has started
+            self.helper_search.value += 1
+            search_id = self.helper_search.value
+            for tasks in self.helper_tasks:
+                tasks.put((search_id, self.board.copy(), self.tt.generation))
+            try:
+                return self._iterative_deepening(time_budget_ms, start_depth, max_depth)
+            finally:
+                self.helper_search.value += 1
+        return self._iterative_deepening(time_budget_ms, start_depth, max_depth)
+
+    def ponder_hit(self, time_budget_ms):
+        # The opponent played the move a ponder search assumed, so that search
+        # becomes the real one. Its budget counts from when pondering started:
+        # after a long think by the opponent it stops at once. Set
+        # ponder_budget_ms = None before the search starts, not here.
+        self.ponder_budget_ms = time_budget_ms
+
+    def _iterative_deepening(self, time_budget_ms, start_depth, max_depth):
+        self.nodes = 0
+        self.qnodes = 0
+        self.beta_cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.null_move_cutoffs = 0
+        self.reductions = 0
+        self.re_searches = 0
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+        self.age_history()
+        self.completed_depth = 0
+        self.pv = []
+        self.pv_moves = {}
+        self.deadline = None
+        start = self.search_start = time.perf_counter()
+        start_ply = len(self.board.history)
+        best_move = None
+
+        for depth in range(min(start_depth, max_depth), max_depth + 1):
+            self.current_depth = depth
+            # The first iteration always completes, so there is a move to play
+            if time_budget_ms is not None and depth > start_depth:
+                self.deadline = start + time_budget_ms / 1000
+            try:
+                score, move = self.negamax(depth, -float('inf'), float('inf'))
+            except SearchTimeout:
+                # Take back the moves the interrupted search left on the board
+                while len(self.board.history) > start_ply:
+                    self.board.unmake_move()
+                break
+            if move is None:
+                break
+            best_move = move_to_rowcol(decode_move(move))
+            self.completed_depth = depth
+            self.last_score = score
+            if self.stats is not None:
+                self.stats.iterations.append((depth, time.perf_counter() - start, self.nodes))
+            self.update_pv(depth)
+            if self.on_iteration is not None:
+                self.on_iteration(self)
+            # A forced mate won't change with more depth
+            if abs(score) > MATE_BOUND:
+                break
+            if self.time_up():
+                break
+
+        self.deadline = None
+        if self.stats is not None:
+            self.stats.update(self, time.perf_counter() - start)
+            SEARCH_LOG.info(json.dumps(self.stats.as_dict()))
+        if best_move is None:
             moves = self.get_all_moves(self.color)
             if moves:
                 return moves[0]
             return None
-        return move
-    
-    def minimax(self, depth, alpha, beta, maximizing_player):
-        if depth == 0 or self.board.game_over:
-            return self.evaluate_board(), None
-            
-        if maximizing_player:
-            max_eval = -float('inf')
-            best_move = None
-            for move in self.get_all_moves(self.color):
-                from_row, from_col, to_row, to_col = move
-                piece = self.board.get_piece(from_row, from_col)
-                captured_piece = self.board.get_piece(to_row, to_col)
-                
-                self.board.board[to_row][to_col] = piece
-                self.board.board[from_row][from_col] = None
-                
-                eval, _ = self.minimax(depth - 1, alpha, beta, False)
-                
-                self.board.board[from_row][from_col] = piece
-                self.board.board[to_row][to_col] = captured_piece
-                
-                if eval > max_eval:
-                    max_eval = eval
-                    best_move = move
-                    
-                alpha = max(alpha, eval)
-                if beta <= alpha:
-                    break
-            return max_eval, best_move
+        return best_move
+
+    def get_book_move(self):
+        if self.book is None:
+            return None
+        packed = self.book.choose_move(self.board.hash_key, self.book_rng)
+        if packed is None:
+            return None
+        move = decode_move(packed)
+        if move not in self.board.generate_legal_moves(self.side):
+            return None
+        return move_to_rowcol(move)
+
+    def get_tablebase_move(self):
+        # In a tablebase ending, play the move that mates fastest, or else
+        # holds the draw, or else delays mate the longest
+        if self.tablebase is None or self.tablebase.probe(self.board) is None:
+            return None
+        board = self.board
+        best_move = None
+        best_rank = None
+        for move in board.generate_legal_moves(board.side):
+            board.make_move(*move)
+            result = self.tablebase.probe(board)
+            board.unmake_move()
+            if result is None:
+                return None
+            wdl, plies = result
+            # Ranked from the mover's side: the opponent's loss is our win
+            rank = (-wdl, -plies if wdl < 0 else plies)
+            if best_rank is None or rank > best_rank:
+                best_move, best_rank = move, rank
+                self.last_score = -wdl * (MATE_SCORE - 1 - plies)
+        if best_move is None:
+            return None
+        return move_to_rowcol(best_move)
+
+    def time_up(self):
+        if self.stop_event is not None and self.stop_event.is_set():
+            return True
+        deadline = self.deadline
+        # A ponder hit only limits the search once it has a move to play
+        if self.ponder_budget_ms is not None and self.completed_depth:
+            deadline = self.search_start + self.ponder_budget_ms / 1000
+        return deadline is not None and time.perf_counter() >= deadline
+
+    def update_pv(self, depth):
+        # Follow the stored best moves from the root to rebuild the principal
+        # variation. The next iteration tries these moves first.
+        board = self.board
+        self.pv = []
+        self.pv_moves = {}
+        seen = set()
+        while len(self.pv) < depth and board.hash_key not in seen:
+            seen.add(board.hash_key)
+            entry = self.tt.probe(board.hash_key)
+            if entry is None or not entry[3]:
+                break
+            move = decode_move(entry[3])
+            if move not in board.generate_legal_moves(board.side):
+                break
+            self.pv_moves[board.hash_key] = entry[3]
+            self.pv.append(move_to_rowcol(move))
+            board.make_move(*move)
+        for _ in self.pv:
+            board.unmake_move()
+
+    def order_moves(self, moves, ply, hash_move=None, pv_move=None):
+        # Sorts on score << 16 | move, so no (score, move) pairs are built
+        if not self.move_ordering:
+            return moves
+        squares = self.board.squares
+        killers = self.killers[ply]
+        history = self.history_scores
+        scored = []
+        for move in moves:
+            to_sq = move >> 6 & 63
+            attacker = squares[move & 63]
+            victim = squares[to_sq]
+            if move == pv_move:
+                score = PV_MOVE_SCORE
+            elif move == hash_move:
+                score = HASH_MOVE_SCORE
+            elif victim is not None:
+                score = CAPTURE_SCORE + MVV_LVA[victim % 6][attacker % 6]
+            elif move & MOVE_PROMOTION:
+                # Promotions win a queen, so they go with the captures
+                score = CAPTURE_SCORE + MVV_LVA[QUEEN][PAWN]
+            elif move == killers[0]:
+                score = KILLER_SCORE
+            elif move == killers[1]:
+                score = KILLER_SCORE - 1
+            else:
+                score = history[attacker][to_sq]
+            scored.append(score << 16 | move)
+        scored.sort(reverse=True)
+        return [key & 0xFFFF for key in scored]
+
+    def record_cutoff(self, move, index, depth, ply):
+        self.beta_cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        from_sq, to_sq = decode_move(move)
+        squares = self.board.squares
+        if squares[to_sq] is not None:
+            return
+        # Quiet move: remember it as a killer for this ply and credit its history
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        scores = self.history_scores[squares[from_sq]]
+        scores[to_sq] += depth * depth
+        if scores[to_sq] >= KILLER_SCORE:
+            self.age_history()
+
+    def age_history(self):
+        for scores in self.history_scores:
+            for sq in range(64):
+                scores[sq] //= 2
+
+    def cutoff_stats(self):
+        return {
+            'nodes': self.nodes,
+            'quiescence_nodes': self.qnodes,
+            'beta_cutoffs': self.beta_cutoffs,
+            'first_move_cutoffs': self.first_move_cutoffs,
+            'first_move_cutoff_rate': self.first_move_cutoffs / self.beta_cutoffs if self.beta_cutoffs else 0.0,
+        }
+
+    def negamax(self, depth, alpha, beta, ply=0, allow_null=True):
+        # Principal variation search: scores are from the side to move. The
+        # first move gets the full window, the rest a null window that only
+        # tells whether they beat alpha, and only those are searched again.
+        self.nodes += 1
+        if not self.nodes & TIME_CHECK_MASK and self.time_up():
+            raise SearchTimeout
+
+        board = self.board
+        if board.game_over:
+            return self.evaluate_board(board.side), None
+        if depth == 0:
+            if not self.use_quiescence:
+                return self.evaluate_board(board.side), None
+            self.q_budget = self.quiescence_node_limit
+            return self.quiescence(alpha, beta), None
+
+        if ply > 0 and self.tablebase is not None:
+            result = self.tablebase.probe(board)
+            if result is not None:
+                wdl, plies = result
+                return wdl * (MATE_SCORE - ply - plies), None
+
+        key = board.hash_key
+        hash_move = None
+        entry = self.tt.probe(key)
+        stats = self.stats
+        if stats is not None:
+            stats.tt_probes += 1
+            if entry is not None:
+                stats.tt_hits += 1
+        if entry is not None:
+            tt_depth, bound, tt_score, packed = entry
+            if packed:
+                hash_move = packed
+            # Never cut at the root, it has to come back with a move
+            if ply > 0 and tt_depth >= depth:
+                tt_score = score_from_tt(tt_score, ply)
+                if (bound == TT_EXACT or (bound == TT_LOWER and tt_score >= beta)
+                        or (bound == TT_UPPER and tt_score <= alpha)):
+                    return tt_score, hash_move
+        alpha_orig = alpha
+
+        side = board.side
+        moves = []
+        in_check = board.packed_moves(side, moves)
+        if not moves:
+            # Checkmate or stalemate
+            return (-(MATE_SCORE - ply) if in_check else 0), None
+
+        # Null-move pruning: if passing still fails high, a real move will
+        # too. Not in check, not twice in a row, not near mate scores, and not
+        # with only king and pawns left, where passing would hide zugzwang.
+        base = side * 6
+        if (self.use_null_move and allow_null and ply > 0 and not in_check
+                and depth >= NULL_MOVE_MIN_DEPTH and abs(beta) < MATE_BOUND
+                and board.pieces[base + KNIGHT] | board.pieces[base + BISHOP]
+                | board.pieces[base + ROOK] | board.pieces[base + QUEEN]
+                and self.evaluate_board(side) >= beta):
+            reduction = NULL_MOVE_REDUCTION + (depth >= NULL_MOVE_DEEP_DEPTH)
+            board.make_null_move()
+            score = -self.negamax(max(0, depth - 1 - reduction), -beta, -beta + 1, ply + 1, False)[0]
+            board.unmake_null_move()
+            if score >= beta:
+                self.null_move_cutoffs += 1
+                return score, None
+
+        moves = self.order_moves(moves, ply, hash_move, self.pv_moves.get(key))
+        killers = self.killers[ply]
+        squares = board.squares
+        best_eval = -float('inf')
+        best_move = None
+        for index, move in enumerate(moves):
+            to_sq = move >> 6 & 63
+            quiet = (squares[to_sq] is None and not move & MOVE_PROMOTION and move != hash_move
+                     and move not in killers)
+            board.make_move(move & 63, to_sq)
+
+            if index == 0:
+                eval = -self.negamax(depth - 1, -beta, -alpha, ply + 1)[0]
+            else:
+                # Late quiet moves that don't give check are searched shallower
+                reduction = 0
+                if (self.use_lmr and quiet and index >= LMR_FULL_MOVES and depth >= LMR_MIN_DEPTH
+                        and not in_check and not board.side_in_check(board.side)):
+                    reduction = min(1 + (index >= LMR_DEEP_MOVES), depth - 2)
+                    self.reductions += 1
+                window = -alpha - 1 if self.use_pvs else -beta
+                eval = -self.negamax(depth - 1 - reduction, window, -alpha, ply + 1)[0]
+                if reduction and eval > alpha:
+                    self.re_searches += 1
+                    eval = -self.negamax(depth - 1, window, -alpha, ply + 1)[0]
+                if self.use_pvs and alpha < eval < beta:
+                    self.re_searches += 1
+                    eval = -self.negamax(depth - 1, -beta, -alpha, ply + 1)[0]
+
+            board.unmake_move()
+
+            if eval > best_eval:
+                best_eval = eval
+                best_move = move
+
+            alpha = max(alpha, eval)
+            if alpha >= beta:
+                self.record_cutoff(move, index, depth, ply)
+                break
+
+        if best_eval <= alpha_orig:
+            bound = TT_UPPER
+        elif best_eval >= beta:
+            bound = TT_LOWER
         else:
-            min_eval = float('inf')
-            best_move = None
-            opponent_color = PieceColor.BLACK if self.color == PieceColor.WHITE else PieceColor.WHITE
-            for move in self.get_all_moves(opponent_color):
-                from_row, from_col, to_row, to_col = move
-                piece = self.board.get_piece(from_row, from_col)
-                captured_piece = self.board.get_piece(to_row, to_col)
-                
-                self.board.board[to_row][to_col] = piece
-                self.board.board[from_row][from_col] = None
-                
-                eval, _ = self.minimax(depth - 1, alpha, beta, True)
-                
-                self.board.board[from_row][from_col] = piece
-                self.board.board[to_row][to_col] = captured_piece
-                
-                if eval < min_eval:
-                    min_eval = eval
-                    best_move = move
-                    
-                beta = min(beta, eval)
-                if beta <= alpha:
-                    break
-            return min_eval, best_move
-    
+            bound = TT_EXACT
+        self.tt.store(key, depth, bound, score_to_tt(best_eval, ply), best_move)
+        return best_eval, best_move
+
+    def quiescence(self, alpha, beta):
+        # Resolve captures and promotions before trusting the static evaluation
+        self.nodes += 1
+        self.qnodes += 1
+        self.q_budget -= 1
+        if not self.nodes & TIME_CHECK_MASK and self.time_up():
+            raise SearchTimeout
+
+        # Stand pat: the side to move can decline every capture
+        board = self.board
+        stand_pat = self.evaluate_board(board.side)
+        if self.q_budget <= 0:
+            return stand_pat
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat + PIECE_VALUES[QUEEN] + DELTA_MARGIN <= alpha:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        squares = board.squares
+        best_eval = stand_pat
+        moves = []
+        board.packed_moves(board.side, moves, captures_only=True)
+        for move in self.order_captures(moves):
+            from_sq = move & 63
+            to_sq = move >> 6 & 63
+            victim = squares[to_sq]
+            gain = PIECE_VALUES[victim % 6] if victim is not None else 0
+            if move & MOVE_PROMOTION:
+                gain += PIECE_VALUES[QUEEN] - PIECE_VALUES[PAWN]
+
+            # Delta pruning
+            if stand_pat + gain + DELTA_MARGIN <= alpha:
+                continue
+
+            board.make_move(from_sq, to_sq)
+            eval = -self.quiescence(-beta, -alpha)
+            board.unmake_move()
+
+            best_eval = max(best_eval, eval)
+            alpha = max(alpha, eval)
+            if alpha >= beta:
+                break
+        return best_eval
+
+    def order_captures(self, moves):
+        squares = self.board.squares
+        scored = []
+        for move in moves:
+            victim = squares[move >> 6 & 63]
+            victim_type = QUEEN if victim is None else victim % 6
+            scored.append(MVV_LVA[victim_type][squares[move & 63] % 6] << 16 | move)
+        scored.sort(reverse=True)
+        return [key & 0xFFFF for key in scored]
+
     def get_all_moves(self, color):
         moves = []
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                piece = self.board.get_piece(r, c)
-                if piece and piece.color == color:
-                    valid_moves = self.board.get_valid_moves(r, c)
-                    for move in valid_moves:
-                        moves.append((r, c, move[0], move[1]))
+        for from_sq, to_sq in self.board.generate_legal_moves(COLOR_INDEX[color]):
+            moves.append(divmod(from_sq, BOARD_SIZE) + divmod(to_sq, BOARD_SIZE))
         return moves
-    
-    def evaluate_board(self):
-        score = 0
-        piece_values = {
-            PieceType.PAWN: 10,
-            PieceType.KNIGHT: 30,
-            PieceType.BISHOP: 30,
-            PieceType.ROOK: 50,
-            PieceType.QUEEN: 90,
-            PieceType.KING: 900
-        }
-        
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                piece = self.board.get_piece(r, c)
-                if piece:
-                    value = piece_values[piece.piece_type]
-                    if piece.color == self.color:
-                        score += value
-                    else:
-                        score -= value
-        
-        center_squares = [(3, 3), (3, 4), (4, 3), (4, 4)]
-        for r, c in center_squares:
-            piece = self.board.get_piece(r, c)
-            if piece and piece.color == self.color:
-                score += 5
-            elif piece and piece.color != self.color:
-                score -= 5
-        return score
+
+    def evaluate_board(self, side=None):
+        # The board keeps material and piece-square scores up to date on every
+        # move, so a leaf only blends the middlegame and endgame totals. The
+        # score is from side's point of view, the AI's own by default.
+        board = self.board
+        phase = min(board.phase, TOTAL_PHASE)
+        score = (board.mg_score * phase + board.eg_score * (TOTAL_PHASE - phase)) // TOTAL_PHASE
+        if side is None:
+            side = self.side
+        return score if side == WHITE_IDX else -score
+
+def _analyze_position(task):
+    # Process pool worker for analyze_positions
+    index, fen, time_budget_ms, depth, tt_size_mb, tablebase_dir, stats = task
+    result = {'index': index, 'fen': fen}
+    try:
+        board = ChessBoard(fen)
+    except ValueError as error:
+        result['error'] = str(error)
+        return result
+    ai = ChessAI(board, INDEX_COLOR[board.side], tt_size_mb=tt_size_mb, tablebase_dir=tablebase_dir, stats=stats)
+    if depth is not None:
+        ai.depth = depth
+    start = time.perf_counter()
+    move = ai.get_move(time_budget_ms=time_budget_ms)
+    elapsed = time.perf_counter() - start
+    ai.close()
+    if move is not None:
+        from_row, from_col, to_row, to_col = move
+        move = move_name(board, from_row * BOARD_SIZE + from_col, to_row * BOARD_SIZE + to_col)
+    result.update(best_move=move, score=ai.last_score, depth=ai.completed_depth, nodes=ai.nodes,
+                  time_ms=int(elapsed * 1000))
+    if stats:
+        result['stats'] = ai.stats.as_dict()
+    return result
+
+def analyze_positions(fens, time_budget_ms=None, depth=None, workers=None, tt_size_mb=16, tablebase_dir=None,
+                      stats=False):
+    # Analyze many FENs across a process pool, yielding a result dict for each
+    # position as soon as it is done (so not in input order; 'index' is the
+    # position's place in fens). Scores are centipawns for the side to move.
+    # A FEN that doesn't parse gives a result with an 'error' instead.
+    # Without a time budget each position is searched to depth (default 2).
+    # With stats, each result also carries the search statistics.
+    context = multiprocessing.get_context('spawn')
+    tasks = ((index, fen, time_budget_ms, depth, tt_size_mb, tablebase_dir, stats)
+             for index, fen in enumerate(fens))
+    with context.Pool(workers) as pool:
+        yield from pool.imap_unordered(_analyze_position, tasks)
+
+class AIWorker:
+    # Runs ChessAI.get_move in a background thread so the pygame loop keeps
+    # handling events and drawing while the AI thinks. The search works on a
+    # copy of the board; the main loop polls for the result and plays it.
+    # Between its moves the AI can ponder: search on the human's time, so its
+    # transposition table is warm, or its answer ready, when the human moves.
+    def __init__(self, ai):
+        self.ai = ai
+        self.thread = None
+        self.stop_event = None
+        self.move = None
+        self.done = False
+        self.cancelled = False
+        # The human reply a ponder search assumes, as (from_sq, to_sq), or
+        # None when it searches the human's position for every reply
+        self.pondering = False
+        self.ponder_move = None
+        # Statistics line of the AI's last move, for the status bar
+        self.summary = ""
+
+    @property
+    def thinking(self):
+        return self.thread is not None and not self.done and not self.pondering
+
+    def start(self, board, time_budget_ms):
+        if self.pondering:
+            history = board.history
+            if self.ponder_move is not None and history and history[-1][:2] == self.ponder_move:
+                # Ponder hit: the search already runs on this position, or
+                # has finished pondering it and its move is ready
+                self.pondering = False
+                self.ai.ponder_hit(time_budget_ms)
+                return
+            # Ponder miss: start over, with the table warmed up for this position
+            self.cancel()
+        self._launch(board.copy(), time_budget_ms=time_budget_ms)
+
+    def ponder(self, board, time_budget_ms):
+        # Search during the human's turn, on the reply the last search
+        # expected if there is one, else on the human's position itself,
+        # for at most time_budget_ms
+        self.ponder_move = None
+        pv = self.ai.pv
+        if len(pv) > 1 and pv[0] == self.move:
+            from_row, from_col, to_row, to_col = pv[1]
+            move = (from_row * BOARD_SIZE + from_col, to_row * BOARD_SIZE + to_col)
+            if move in board.generate_legal_moves(board.side):
+                self.ponder_move = move
+        position = board.copy()
+        if self.ponder_move is not None:
+            position.make_move(*self.ponder_move)
+        self.pondering = True
+        self._launch(position, time_budget_ms=time_budget_ms, ponder=True)
+
+    def _launch(self, board, **search_args):
+        self.ai.board = board
+        # A fresh event per search, so a stop can't be lost before it starts,
+        # and likewise a ponder hit is cleared here rather than in the search
+        self.stop_event = self.ai.stop_event = threading.Event()
+        self.ai.ponder_budget_ms = None
+        self.move = None
+        self.done = False
+        self.cancelled = False
+        self.thread = threading.Thread(target=self._run, args=(search_args,), daemon=True)
+        self.thread.start()
+
+    def _run(self, search_args):
+        self.move = self.ai.get_move(**search_args)
+        self.done = True
+
+    def poll(self):
+        # The finished search's move, once; None while thinking or after cancel
+        if self.thread is None or not self.done or self.pondering:
+            return None
+        self.thread = None
+        if self.cancelled:
+            return None
+        if self.ai.stats is not None and self.ai.stats.iterations:
+            self.summary = self.ai.stats.summary()
+        return self.move
+
+    def cancel(self):
+        if self.thread is not None:
+            self.cancelled = True
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+        self.pondering = False
 
 # Global variable to track if Unicode symbols work
 unicode_symbols_work = True
@@ -611,130 +2298,201 @@ unicode_symbols_work = True
 def test_unicode_support():
     """Test if Unicode chess symbols work with available fonts"""
     global unicode_symbols_work
-    test_font = get_chess_font(48)
-    test_surface = test_font.render('♔', True, BLACK)
-    unicode_symbols_work = test_surface.get_width() > 5  # More reliable test
+    # Tested by probe_fonts, or remembered from an earlier launch
+    unicode_symbols_work = discover_fonts()['unicode']
 
-def draw_board():
-    # Draw chess board squares
-    for row in range(BOARD_SIZE):
-        for col in range(BOARD_SIZE):
-            color = LIGHT_BROWN if (row + col) % 2 == 0 else DARK_BROWN
-            pygame.draw.rect(screen, color, (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-            
-            # Draw coordinates
-            font_small = pygame.font.SysFont('Arial', 14)
-            if row == 7:  # File letters at bottom
-                file_letter = chr(97 + col)  # a-h
-                text = font_small.render(file_letter, True, BLACK if (row + col) % 2 == 0 else WHITE)
-                screen.blit(text, (col * SQUARE_SIZE + 5, row * SQUARE_SIZE + SQUARE_SIZE - 15))
-            if col == 0:  # Rank numbers on left
-                rank_number = str(8 - row)
-                text = font_small.render(rank_number, True, BLACK if (row + col) % 2 == 0 else WHITE)
-                screen.blit(text, (col * SQUARE_SIZE + 5, row * SQUARE_SIZE + 5))
-
-def draw_pieces(board):
-    font = get_chess_font(48)
-    
-    for row in range(BOARD_SIZE):
-        for col in range(BOARD_SIZE):
-            piece = board.get_piece(row, col)
-            if piece:
-                text_color = WHITE if piece.color == PieceColor.WHITE else BLACK
-                
-                if unicode_symbols_work:
-                    symbol = piece.get_symbol()
-                else:
-                    symbol = piece.get_text_fallback()
-                
-                text = font.render(symbol, True, text_color)
-                text_rect = text.get_rect(center=(col * SQUARE_SIZE + SQUARE_SIZE // 2, 
-                                                 row * SQUARE_SIZE + SQUARE_SIZE // 2))
-                screen.blit(text, text_rect)
-
-def draw_highlights(board):
-    if board.selected_piece:
-        row, col = board.selected_piece
-        # Highlight selected piece
-        highlight_surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-        highlight_surface.fill((255, 255, 0, 100))  # Yellow highlight
-        screen.blit(highlight_surface, (col * SQUARE_SIZE, row * SQUARE_SIZE))
-        
-        # Highlight valid moves
-        for move in board.valid_moves:
-            row, col = move
-            highlight_surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-            highlight_surface.fill((0, 255, 0, 100))  # Green highlight for moves
-            screen.blit(highlight_surface, (col * SQUARE_SIZE, row * SQUARE_SIZE))
-
-def draw_status_bar(board):
-    # Draw status bar background
-    status_rect = pygame.Rect(0, HEIGHT - 40, WIDTH, 40)
-    pygame.draw.rect(screen, STATUS_BG, status_rect)
-    pygame.draw.line(screen, BLACK, (0, HEIGHT - 40), (WIDTH, HEIGHT - 40), 2)
-    
-    font = pygame.font.SysFont('Arial', 20)
-    
-    # Turn indicator
-    turn_text = "White's Turn" if board.turn == PieceColor.WHITE else "Black's Turn (AI)"
-    turn_color = BLUE if board.turn == PieceColor.WHITE else RED
-    text = font.render(turn_text, True, turn_color)
-    screen.blit(text, (10, HEIGHT - 30))
-    
-    # Game status
-    status_text = ""
-    if board.game_over:
-        winner = "White" if board.winner == PieceColor.WHITE else "Black"
-        status_text = f"Checkmate! {winner} wins!"
-    elif board.check:
-        status_text = "Check!"
-    
-    if status_text:
-        text = font.render(status_text, True, RED)
-        screen.blit(text, (WIDTH // 2 - 50, HEIGHT - 30))
-    
-    # Symbol status
-    symbol_status = "Using Unicode symbols" if unicode_symbols_work else "Using text symbols"
-    text = font.render(symbol_status, True, GREEN if unicode_symbols_work else RED)
-    screen.blit(text, (WIDTH - 200, HEIGHT - 30))
+class Renderer:
+    # Draws the game with everything that doesn't change pre-rendered once:
+    # the board with its coordinates, one glyph per piece and the highlight
+    # overlays. Each frame only the squares (and status bar) whose contents
+    # changed are redrawn, and draw() returns their rects for
+    # pygame.display.update, so an idle board costs next to nothing.
+    def __init__(self):
+        self.background = pygame.Surface((WIDTH, BOARD_SIZE * SQUARE_SIZE))
+        font_small = get_text_font(14)
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                light = (row + col) % 2 == 0
+                color = LIGHT_BROWN if light else DARK_BROWN
+                pygame.draw.rect(self.background, color,
+                                 (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+
+                # Draw coordinates
+                if row == 7:  # File letters at bottom
+                    text = font_small.render(chr(97 + col), True, BLACK if light else WHITE)
+                    self.background.blit(text, (col * SQUARE_SIZE + 5, row * SQUARE_SIZE + SQUARE_SIZE - 15))
+                if col == 0:  # Rank numbers on left
+                    text = font_small.render(str(8 - row), True, BLACK if light else WHITE)
+                    self.background.blit(text, (col * SQUARE_SIZE + 5, row * SQUARE_SIZE + 5))
+
+        # Piece glyphs by piece code
+        font = get_chess_font(48)
+        self.glyphs = []
+        symbols = PIECE_SYMBOLS if unicode_symbols_work else PIECE_TEXT
+        for code in range(12):
+            self.glyphs.append(font.render(symbols[code], True, WHITE if code // 6 == WHITE_IDX else BLACK))
+
+        # Highlight overlays: yellow for the selected piece, green for its moves
+        self.highlights = {}
+        for kind, color in (('selected', (255, 255, 0, 100)), ('move', (0, 255, 0, 100))):
+            surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
+            surface.fill(color)
+            self.highlights[kind] = surface
+
+        self.status_font = get_text_font(20)
+        self.stats_font = get_text_font(14)
+        self.status_rect = pygame.Rect(0, HEIGHT - 40, WIDTH, 40)
+        self.overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+        self.overlay.fill((0, 0, 0, 150))
+        self.font_large = get_text_font(48)
+        self.font_small = get_text_font(24)
+        self.invalidate()
 
-def draw_game_over(board):
-    if board.game_over:
+    def invalidate(self):
+        # Forget what is on screen so the next frame redraws everything
+        self.drawn_squares = [None] * 64
+        self.drawn_status = None
+        self.drawn_game_over = None
+
+    def draw(self, board, worker=None):
+        if board.game_over != self.drawn_game_over:
+            self.invalidate()
+            self.drawn_game_over = board.game_over
+        # The overlay covers the whole window, so behind it nothing is redrawn
+        if board.game_over and self.drawn_squares[0] is not None:
+            return []
+
+        highlights = {}
+        if board.selected_piece:
+            for row, col in board.valid_moves:
+                highlights[row * BOARD_SIZE + col] = 'move'
+            row, col = board.selected_piece
+            highlights[row * BOARD_SIZE + col] = 'selected'
+
+        dirty = []
+        for sq, code in enumerate(board.squares):
+            state = (code, highlights.get(sq))
+            if state != self.drawn_squares[sq]:
+                self.drawn_squares[sq] = state
+                dirty.append(self.draw_square(sq, *state))
+
+        if self.draw_status_bar(board, worker):
+            dirty.append(self.status_rect)
+
+        if board.game_over:
+            self.draw_game_over(board)
+            return [screen.get_rect()]
+        return dirty
+
+    def draw_square(self, sq, code, highlight):
+        row, col = divmod(sq, BOARD_SIZE)
+        rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+        screen.blit(self.background, rect, rect)
+        if highlight:
+            screen.blit(self.highlights[highlight], rect)
+        if code is not None:
+            glyph = self.glyphs[code]
+            screen.blit(glyph, glyph.get_rect(center=rect.center))
+        return rect
+
+    def draw_status_bar(self, board, worker=None):
+        # Turn indicator, with live search progress while the AI thinks
+        turn_text = "White's Turn" if board.turn == PieceColor.WHITE else "Black's Turn (AI)"
+        if worker is not None and worker.thinking:
+            turn_text = f"AI thinking... depth {worker.ai.current_depth}, {worker.ai.nodes} nodes"
+        turn_color = BLUE if board.turn == PieceColor.WHITE else RED
+
+        # Game status
+        status_text = ""
+        if board.game_over:
+            winner = "White" if board.winner == PieceColor.WHITE else "Black"
+            status_text = f"Checkmate! {winner} wins!"
+        elif board.check:
+            status_text = "Check!"
+
+        # Statistics of the AI's last search, when it collects them
+        stats_text = ""
+        if worker is not None and not worker.thinking:
+            stats_text = worker.summary
+
+        state = (turn_text, turn_color, status_text, stats_text)
+        if state == self.drawn_status:
+            return False
+        self.drawn_status = state
+
+        # Draw status bar background
+        pygame.draw.rect(screen, STATUS_BG, self.status_rect)
+        pygame.draw.line(screen, BLACK, (0, HEIGHT - 40), (WIDTH, HEIGHT - 40), 2)
+        font = self.status_font
+        screen.blit(font.render(turn_text, True, turn_color), (10, HEIGHT - 30))
+        if status_text:
+            screen.blit(font.render(status_text, True, RED), (WIDTH // 2 - 50, HEIGHT - 30))
+
+        if stats_text:
+            text = self.stats_font.render(stats_text, True, BLACK)
+            screen.blit(text, text.get_rect(midright=(WIDTH - 10, HEIGHT - 20)))
+            return True
+
+        # Symbol status
+        symbol_status = "Using Unicode symbols" if unicode_symbols_work else "Using text symbols"
+        text = font.render(symbol_status, True, GREEN if unicode_symbols_work else RED)
+        screen.blit(text, (WIDTH - 200, HEIGHT - 30))
+        return True
+
+    def draw_game_over(self, board):
         # Semi-transparent overlay
-        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 150))
-        screen.blit(overlay, (0, 0))
-        
-        font_large = pygame.font.SysFont('Arial', 48)
-        font_small = pygame.font.SysFont('Arial', 24)
-        
+        screen.blit(self.overlay, (0, 0))
+
         winner = "White" if board.winner == PieceColor.WHITE else "Black"
-        text = font_large.render(f"{winner} Wins!", True, GREEN)
+        text = self.font_large.render(f"{winner} Wins!", True, GREEN)
         text_rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 20))
         screen.blit(text, text_rect)
-        
-        restart_text = font_small.render("Press R to restart", True, WHITE)
+
+        restart_text = self.font_small.render("Press R to restart", True, WHITE)
         restart_rect = restart_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 + 30))
         screen.blit(restart_text, restart_rect)
 
+def create_ai(board):
+    book_path = OPENING_BOOK_PATH if os.path.exists(OPENING_BOOK_PATH) else None
+    tablebase_dir = TABLEBASE_DIR if os.path.isdir(TABLEBASE_DIR) else None
+    try:
+        return ChessAI(board, PieceColor.BLACK, workers=AI_WORKERS, book_path=book_path,
+                       tablebase_dir=tablebase_dir, stats=AI_SEARCH_STATS)
+    except ValueError:
+        # A damaged book file: play without the book
+        return ChessAI(board, PieceColor.BLACK, workers=AI_WORKERS,
+                       tablebase_dir=tablebase_dir, stats=AI_SEARCH_STATS)
+
 def main():
+    init_display()
+
     # Test Unicode support at startup
     test_unicode_support()
     
+    renderer = Renderer()
     board = ChessBoard()
-    ai = ChessAI(board, PieceColor.BLACK)
+    ai = create_ai(board)
+    worker = AIWorker(ai)
     
     running = True
     while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                worker.cancel()
+                ai.close()
                 running = False
+
+            if event.type == pygame.VIDEOEXPOSE:
+                renderer.invalidate()
                 
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_r and board.game_over:
-                    # Restart game
+                if event.key == pygame.K_r and (board.game_over or worker.thinking):
+                    # Restart game, abandoning any search in progress
+                    worker.cancel()
+                    ai.close()
                     board = ChessBoard()
-                    ai = ChessAI(board, PieceColor.BLACK)
+                    ai = create_ai(board)
+                    worker = AIWorker(ai)
                 
             if not board.game_over and board.turn == PieceColor.WHITE:
                 if event.type == pygame.MOUSEBUTTONDOWN:
@@ -758,22 +2516,22 @@ def main():
                         else:
                             board.select_piece(row, col)
         
-        # AI move
-        if not board.game_over and board.turn == PieceColor.BLACK:
-            move = ai.get_move()
-            if move:
-                from_row, from_col, to_row, to_col = move
-                board.move_piece(from_row, from_col, to_row, to_col)
-        
-        # Draw everything
-        screen.fill(WHITE)
-        draw_board()
-        draw_highlights(board)
-        draw_pieces(board)
-        draw_status_bar(board)
-        draw_game_over(board)
+        # AI move: start a background search, then play its move once it's done
+        if running and not board.game_over and board.turn == PieceColor.BLACK:
+            if worker.thread is None or worker.pondering:
+                worker.start(board, AI_MOVE_TIME_MS)
+            else:
+                move = worker.poll()
+                if move:
+                    from_row, from_col, to_row, to_col = move
+                    board.move_piece(from_row, from_col, to_row, to_col)
+                    if AI_PONDER and not board.game_over:
+                        worker.ponder(board, AI_PONDER_TIME_MS)
+        elif board.game_over and worker.pondering:
+            worker.cancel()
         
-        pygame.display.flip()
+        # Draw what changed and push only those rects to the display
+        pygame.display.update(renderer.draw(board, worker))
         clock.tick(FPS)
     
     pygame.quit()
@@ -0,0 +1,81 @@
+import argparse
+import sys
+import time
+
+from chess import ChessBoard, START_FEN, move_name
+
+# Standard perft positions with their published node counts. The game has no
+# castling or en passant and always promotes to a queen, so only the depths
+# whose counts don't involve those rules are listed.
+PERFT_SUITE = [
+    ("Initial position", START_FEN,
+     {1: 20, 2: 400, 3: 8902, 4: 197281}),
+    ("Position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191}),
+    ("Position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6}),
+    ("Position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890}),
+]
+
+def run_perft(fen, depth):
+    board = ChessBoard()
+    board.load_fen(fen)
+    start = time.perf_counter()
+    nodes = board.perft(depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed
+
+def divide(fen, depth):
+    # Node count below each root move, for tracking down a wrong total
+    board = ChessBoard()
+    board.load_fen(fen)
+    total = 0
+    for move in board.generate_legal_moves(board.side):
+        name = move_name(board, *move)
+        board.make_move(*move)
+        nodes = board.perft(depth - 1)
+        board.unmake_move()
+        print(f"{name}: {nodes}")
+        total += nodes
+    print(f"Total: {total}")
+
+def run_suite(max_depth):
+    failures = 0
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, counts in PERFT_SUITE:
+        for depth, expected in sorted(counts.items()):
+            if depth > max_depth:
+                continue
+            nodes, elapsed = run_perft(fen, depth)
+            total_nodes += nodes
+            total_time += elapsed
+            status = "ok" if nodes == expected else f"FAIL (expected {expected})"
+            print(f"{name:<18} depth {depth}: {nodes:>9} nodes  {elapsed:7.2f}s  {status}")
+            if nodes != expected:
+                failures += 1
+    if total_time:
+        print(f"{total_nodes} nodes in {total_time:.2f}s ({total_nodes / total_time:.0f} nodes/s)")
+    print("All counts match" if not failures else f"{failures} count(s) wrong")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft move generator benchmark and validation")
+    parser.add_argument("depth", type=int, nargs="?", default=4, help="search depth (default 4)")
+    parser.add_argument("--fen", default=START_FEN, help="position to count from")
+    parser.add_argument("--divide", action="store_true", help="show the count below each root move")
+    parser.add_argument("--suite", action="store_true",
+                        help="check the standard positions up to depth against their known counts")
+    args = parser.parse_args()
+
+    if args.suite:
+        sys.exit(1 if run_suite(args.depth) else 0)
+    if args.divide:
+        divide(args.fen, args.depth)
+        return
+    nodes, elapsed = run_perft(args.fen, args.depth)
+    print(f"Depth {args.depth}: {nodes} nodes in {elapsed:.2f}s ({nodes / max(elapsed, 1e-9):.0f} nodes/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+from collections import defaultdict
+
+from chess import (Tablebase, TABLEBASE_DIR, TB_MAGIC, TB_MAX_PIECES, TB_ILLEGAL, TB_LETTERS, TB_ORDER,
+                   TB_KING_SQUARES, PAWN, QUEEN, KING, WHITE_IDX, BLACK_IDX, FULL_BB, PAWN_ATTACKS,
+                   piece_attacks, bb_squares, tablebase_name, tablebase_size, tablebase_index)
+
+# Retrograde analysis: every position of a material balance is listed, the
+# checkmates are found, and the results are walked backwards one ply at a
+# time with un-moves. Captures and promotions leave the table, so the tables
+# they lead to are built first and probed.
+
+def table_codes(name):
+    # Piece codes of a table in its piece order, e.g. KQvK -> [K, Q, k]
+    white, black = name.split('v')
+    return ([TB_LETTERS.index(letter) for letter in white] +
+            [6 + TB_LETTERS.index(letter) for letter in black])
+
+def all_tables(max_pieces):
+    # Every material balance with up to max_pieces pieces (bare kings aside)
+    names = set()
+    kinds = [(color, piece_type) for color in (0, 1) for piece_type in TB_ORDER if piece_type != KING]
+    for extra in range(1, max_pieces - 1):
+        for combo in itertools.combinations_with_replacement(kinds, extra):
+            codes = sorted([KING, 6 + KING] + [color * 6 + piece_type for color, piece_type in combo],
+                           key=lambda code: (code // 6, TB_ORDER.index(code % 6)))
+            names.add(tablebase_name(codes)[0])
+    return sorted(names, key=lambda name: (len(name), name))
+
+def dependencies(name):
+    # Tables reached by a capture or a promotion
+    codes = table_codes(name)
+    children = set()
+    for slot, code in enumerate(codes):
+        if code % 6 == KING:
+            continue
+        variants = [codes[:slot] + codes[slot + 1:]]
+        if code % 6 == PAWN:
+            variants.append(codes[:slot] + [code - PAWN + QUEEN] + codes[slot + 1:])
+        for variant in variants:
+            if len(variant) > 2:
+                variant.sort(key=lambda code: (code // 6, TB_ORDER.index(code % 6)))
+                children.add(tablebase_name(variant)[0])
+    return children
+
+class Generator:
+    def __init__(self, name, directory):
+        self.name = name
+        self.codes = table_codes(name)
+        self.colors = [code // 6 for code in self.codes]
+        self.pawnless = 'P' not in name
+        self.king_squares = TB_KING_SQUARES[self.pawnless]
+        self.size = tablebase_size(name)
+        self.others = Tablebase(directory)
+        self.values = bytearray(self.size)
+
+    def decode(self, index):
+        squares = []
+        for _ in range(len(self.codes) - 1):
+            index, sq = divmod(index, 64)
+            squares.append(sq)
+        side, slot = divmod(index, len(self.king_squares))
+        squares.append(self.king_squares[slot])
+        squares.reverse()
+        return squares, side
+
+    def attacked(self, squares, sq, by_side, occupied):
+        for code, color, piece_sq in zip(self.codes, self.colors, squares):
+            if color == by_side and piece_sq is not None and piece_attacks(code, piece_sq, occupied) >> sq & 1:
+                return True
+        return False
+
+    def occupancy(self, squares):
+        occupied = [0, 0]
+        for color, sq in zip(self.colors, squares):
+            if sq is not None:
+                occupied[color] |= 1 << sq
+        return occupied
+
+    def is_legal(self, squares, side):
+        if len(set(squares)) != len(squares):
+            return False
+        for code, sq in zip(self.codes, squares):
+            if code % 6 == PAWN and (sq < 8 or sq >= 56):
+                return False
+        occupied = self.occupancy(squares)
+        king = squares[self.colors.index(side ^ 1)]
+        return not self.attacked(squares, king, side, occupied[0] | occupied[1])
+
+    def moves(self, squares, side):
+        # Legal moves as (child squares, moved slot, captured slot, promoted),
+        # where a captured piece's square becomes None
+        occupied = self.occupancy(squares)
+        own = occupied[side]
+        enemy = occupied[side ^ 1]
+        both = own | enemy
+        king_slot = self.colors.index(side)
+        moves = []
+        for slot, code in enumerate(self.codes):
+            if self.colors[slot] != side:
+                continue
+            sq = squares[slot]
+            if code % 6 == PAWN:
+                empty = ~both & FULL_BB
+                if side == WHITE_IDX:
+                    targets = (1 << sq >> 8) & empty
+                    if targets and sq >= 48:
+                        targets |= (targets >> 8) & empty
+                else:
+                    targets = (1 << sq << 8) & empty
+                    if targets and sq < 16:
+                        targets |= (targets << 8) & empty
+                targets |= PAWN_ATTACKS[side][sq] & enemy
+            else:
+                targets = piece_attacks(code, sq, both) & ~own
+            for to_sq in bb_squares(targets):
+                child = squares[:]
+                child[slot] = to_sq
+                captured = None
+                if enemy >> to_sq & 1:
+                    captured = squares.index(to_sq)
+                    child[captured] = None
+                after = (both & ~(1 << sq)) | (1 << to_sq)
+                if self.attacked(child, child[king_slot], side ^ 1, after):
+                    continue
+                promoted = code % 6 == PAWN and (to_sq < 8 or to_sq >= 56)
+                moves.append((child, slot, captured, promoted))
+        return moves
+
+    def child_result(self, child, moved, captured, promoted, side):
+        # (wdl, plies) of a move's result for the opponent, or None if it
+        # stays in this table
+        if captured is None and not promoted:
+            return None
+        pieces = []
+        for slot, (code, sq) in enumerate(zip(self.codes, child)):
+            if sq is None:
+                continue
+            if promoted and slot == moved:
+                code += QUEEN - PAWN
+            pieces.append((code, sq))
+        result = self.others.probe_pieces(pieces, side ^ 1)
+        if result is None:
+            raise RuntimeError(f"{self.name} needs the tables it captures or promotes into")
+        return result
+
+    def unmoves(self, squares, side):
+        # Positions one quiet move earlier: the side that just moved is side ^ 1
+        mover = side ^ 1
+        occupied = self.occupancy(squares)
+        both = occupied[0] | occupied[1]
+        empty = ~both & FULL_BB
+        for slot, code in enumerate(self.codes):
+            if self.colors[slot] != mover:
+                continue
+            sq = squares[slot]
+            if code % 6 == PAWN:
+                step = 8 if mover == WHITE_IDX else -8
+                origins = 0
+                if empty >> (sq + step) & 1 and 8 <= sq + step < 56:
+                    origins |= 1 << (sq + step)
+                    double = sq + 2 * step
+                    if (mover == WHITE_IDX and double // 8 == 6) or (mover == BLACK_IDX and double // 8 == 1):
+                        if empty >> double & 1:
+                            origins |= 1 << double
+            else:
+                origins = piece_attacks(code, sq, both) & empty
+            for from_sq in bb_squares(origins):
+                parent = squares[:]
+                parent[slot] = from_sq
+                yield tablebase_index(parent, mover, self.pawnless)
+
+    def loss_depth(self, index):
+        # If every move from the position loses (the opponent wins), the
+        # longest of those mates, else None
+        squares, side = self.decode(index)
+        longest = 0
+        for child, moved, captured, promoted in self.moves(squares, side):
+            result = self.child_result(child, moved, captured, promoted, side)
+            if result is None:
+                value = self.values[tablebase_index(child, side ^ 1, self.pawnless)]
+                if value == 0 or value == TB_ILLEGAL or (value - 1) % 2 == 0:
+                    return None
+                plies = value - 1
+            else:
+                wdl, plies = result
+                if wdl != 1:
+                    return None
+            longest = max(longest, plies)
+        return longest
+
+    def generate(self):
+        values = self.values
+        # Results decided by a capture or promotion wait in pending until the
+        # walk reaches their distance
+        pending = defaultdict(list)
+        current = []
+        for index in range(self.size):
+            squares, side = self.decode(index)
+            # Positions stored under their mirror image are left out too
+            if not self.is_legal(squares, side) or tablebase_index(squares, side, self.pawnless) != index:
+                values[index] = TB_ILLEGAL
+                continue
+            moves = self.moves(squares, side)
+            if not moves:
+                occupied = self.occupancy(squares)
+                king = squares[self.colors.index(side)]
+                if self.attacked(squares, king, side ^ 1, occupied[0] | occupied[1]):
+                    values[index] = 1
+                    current.append(index)
+                continue
+            fastest_win = None
+            exits = []
+            for child, moved, captured, promoted in moves:
+                result = self.child_result(child, moved, captured, promoted, side)
+                if result is None:
+                    continue
+                exits.append(result)
+                wdl, plies = result
+                if wdl == -1 and (fastest_win is None or plies + 1 < fastest_win):
+                    fastest_win = plies + 1
+            if fastest_win is not None:
+                pending[fastest_win].append(index)
+            elif len(exits) == len(moves) and all(wdl == 1 for wdl, _ in exits):
+                pending[max(plies for _, plies in exits) + 1].append(index)
+
+        scheduled = set()
+        level = 0
+        while current or pending:
+            nxt = []
+            for index in current:
+                squares, side = self.decode(index)
+                for parent in self.unmoves(squares, side):
+                    if values[parent] or parent in scheduled:
+                        continue
+                    if level % 2 == 0:
+                        # The position is lost for its side to move, so the
+                        # move into it wins
+                        values[parent] = level + 2
+                        nxt.append(parent)
+                        continue
+                    longest = self.loss_depth(parent)
+                    if longest is None:
+                        continue
+                    if longest == level:
+                        values[parent] = level + 2
+                        nxt.append(parent)
+                    else:
+                        scheduled.add(parent)
+                        pending[longest + 1].append(parent)
+            level += 1
+            for index in pending.pop(level, ()):
+                if not values[index]:
+                    values[index] = level + 1
+                    nxt.append(index)
+            current = nxt
+        return values
+
+def write_table(path, values):
+    with open(path, 'wb') as f:
+        f.write(TB_MAGIC)
+        f.write(values)
+
+def build(name, directory, built):
+    if name in built:
+        return
+    for child in sorted(dependencies(name)):
+        build(child, directory, built)
+    path = os.path.join(directory, name + '.tb')
+    if not os.path.exists(path):
+        start = time.perf_counter()
+        values = Generator(name, directory).generate()
+        write_table(path, values)
+        positions = sum(1 for value in values if value != TB_ILLEGAL)
+        wins = sum(1 for value in values if value != TB_ILLEGAL and value and value % 2 == 0)
+        longest = max((value - 1 for value in values if value != TB_ILLEGAL and value), default=0)
+        print(f"{name}: {positions} positions, {wins} wins, longest mate {longest} plies "
+              f"({time.perf_counter() - start:.1f}s)", file=sys.stderr)
+    built.add(name)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate endgame tablebases for the chess AI")
+    parser.add_argument("tables", nargs="*", help="tables to build, e.g. KQvK KRvK KPvK (default: all of --pieces)")
+    parser.add_argument("--pieces", type=int, default=3, choices=range(3, TB_MAX_PIECES + 1),
+                        help="build every table with up to this many pieces")
+    parser.add_argument("-d", "--directory", default=TABLEBASE_DIR, help="directory to write the tables to")
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    names = args.tables or all_tables(args.pieces)
+    built = set()
+    for name in names:
+        codes = table_codes(name)
+        if len(codes) > TB_MAX_PIECES or tablebase_name(codes)[0] != name:
+            parser.error(f"{name} is not a table name (stronger side first, at most {TB_MAX_PIECES} pieces)")
+        build(name, args.directory, built)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import ast
+import csv
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from chess import (ChessBoard, ChessAI, GameArchive, START_FEN, INDEX_COLOR, WHITE_IDX, BLACK_IDX, KING,
+                   BOARD_SIZE)
+
+# Self-play matches between two ChessAI configurations. Each opening is played
+# twice with the colors swapped, so neither engine profits from a lucky
+# opening or from having White more often.
+
+# Arguments that go to the ChessAI constructor; any other setting is set as
+# an attribute on the AI (e.g. move_ordering=False, quiescence_node_limit=500)
+CONSTRUCTOR_ARGS = {'tt_size_mb', 'workers', 'book_path', 'tablebase_dir', 'stats'}
+MAX_PLIES = 300  # Games that last longer are scored as draws
+
+def parse_config(text):
+    # "key=value key=value" -> dict, values as Python literals
+    config = {}
+    for item in text.split():
+        key, _, value = item.partition('=')
+        try:
+            config[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            config[key] = value
+    return config
+
+def create_ai(board, color, config):
+    ai = ChessAI(board, color, **{key: value for key, value in config.items() if key in CONSTRUCTOR_ARGS})
+    for key, value in config.items():
+        if key not in CONSTRUCTOR_ARGS:
+            if not hasattr(ai, key):
+                raise ValueError(f"ChessAI has no setting {key!r}")
+            setattr(ai, key, value)
+    return ai
+
+def random_openings(count, plies, seed):
+    # Start positions reached by a few random legal moves from the initial
+    # position, skipping ones where the random moves blundered into a mate
+    rng = random.Random(seed)
+    openings = []
+    while len(openings) < count:
+        board = ChessBoard()
+        for _ in range(plies):
+            moves = board.generate_legal_moves(board.side)
+            if not moves:
+                break
+            board.make_move(*rng.choice(moves))
+        if board.generate_legal_moves(board.side):
+            openings.append(board.get_fen())
+    return openings
+
+def play_game(task):
+    # Process pool worker: one game from fen, engine A playing a_side.
+    # Returns the result from A's point of view plus per-engine search stats.
+    game_id, fen, a_side, configs, movetime_ms, depth = task
+    board = ChessBoard(fen)
+    engines = {a_side: 'a', a_side ^ 1: 'b'}
+    ais = {}
+    for side, name in engines.items():
+        ais[side] = create_ai(board, INDEX_COLOR[side], configs[name])
+        if depth is not None:
+            ais[side].depth = depth
+    stats = {name: {'moves': 0, 'nodes': 0, 'time': 0.0} for name in ('a', 'b')}
+    seen = {}
+    result = None
+    reason = 'max plies'
+    for _ in range(MAX_PLIES):
+        moves, in_check = board.legal_moves(board.side)
+        if not moves:
+            if in_check:
+                result = 1.0 if board.side != a_side else 0.0
+                reason = 'checkmate'
+            else:
+                reason = 'stalemate'
+            break
+        seen[board.hash_key] = seen.get(board.hash_key, 0) + 1
+        if seen[board.hash_key] >= 3:
+            reason = 'repetition'
+            break
+        kings = board.pieces[WHITE_IDX * 6 + KING] | board.pieces[BLACK_IDX * 6 + KING]
+        if (board.occupied[WHITE_IDX] | board.occupied[BLACK_IDX]) == kings:
+            reason = 'bare kings'
+            break
+        ai = ais[board.side]
+        ai.nodes = 0
+        start = time.perf_counter()
+        move = ai.get_move(time_budget_ms=movetime_ms if depth is None else None)
+        elapsed = time.perf_counter() - start
+        side_stats = stats[engines[board.side]]
+        side_stats['moves'] += 1
+        side_stats['nodes'] += ai.nodes
+        side_stats['time'] += elapsed
+        from_row, from_col, to_row, to_col = move
+        board.make_move(from_row * BOARD_SIZE + from_col, to_row * BOARD_SIZE + to_col)
+    for ai in ais.values():
+        ai.close()
+    return {
+        'game': game_id,
+        'opening': fen,
+        'a_color': 'white' if a_side == WHITE_IDX else 'black',
+        'result': 0.5 if result is None else result,
+        'reason': reason,
+        'plies': len(board.history),
+        'stats': stats,
+        'moves': board.packed_history(),
+    }
+
+def elo_estimate(scores):
+    # Elo difference for A with a 95% confidence interval, from per-game
+    # scores (1, 0.5 or 0)
+    games = len(scores)
+    mean = sum(scores) / games
+    variance = sum((score - mean) ** 2 for score in scores) / games
+    margin = 1.96 * math.sqrt(variance / games)
+
+    def elo(score):
+        # A clean sweep (or a bound past it) has no finite Elo, so count it as
+        # half a game short of perfect to keep the results file valid JSON
+        score = min(max(score, 0.5 / games), 1 - 0.5 / games)
+        return 400 * math.log10(score / (1 - score))
+
+    diff = elo(mean)
+    return diff, elo(mean - margin), elo(mean + margin)
+
+def summarize(games, configs, movetime_ms, depth):
+    scores = [game['result'] for game in games]
+    wins = scores.count(1.0)
+    draws = scores.count(0.5)
+    losses = scores.count(0.0)
+    elo, elo_low, elo_high = elo_estimate(scores)
+    summary = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'engine_a': configs['a'],
+        'engine_b': configs['b'],
+        'movetime_ms': movetime_ms,
+        'depth': depth,
+        'games': len(games),
+        'wins': wins,
+        'draws': draws,
+        'losses': losses,
+        'score': sum(scores) / len(scores),
+        'elo': elo,
+        'elo_low': elo_low,
+        'elo_high': elo_high,
+    }
+    for name in ('a', 'b'):
+        moves = sum(game['stats'][name]['moves'] for game in games)
+        nodes = sum(game['stats'][name]['nodes'] for game in games)
+        seconds = sum(game['stats'][name]['time'] for game in games)
+        summary[f'nps_{name}'] = nodes / seconds if seconds else 0.0
+        summary[f'ms_per_move_{name}'] = seconds * 1000 / moves if moves else 0.0
+    return summary
+
+def write_csv(path, summary):
+    # One row per match, appended, so a file tracks results over time
+    row = dict(summary, engine_a=json.dumps(summary['engine_a']), engine_b=json.dumps(summary['engine_b']))
+    new_file = not os.path.exists(path)
+    with open(path, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(row))
+        if new_file:
+            writer.writeheader()
+        writer.writerow(row)
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a self-play match between two ChessAI configurations")
+    parser.add_argument("--engine-a", default="", help="settings for engine A, e.g. \"move_ordering=False\"")
+    parser.add_argument("--engine-b", default="", help="settings for engine B (the baseline)")
+    parser.add_argument("-n", "--games", type=int, default=100, help="number of games (rounded up to even)")
+    parser.add_argument("--movetime", type=int, default=100, help="time per move in ms")
+    parser.add_argument("--depth", type=int, help="search to a fixed depth instead of by time")
+    parser.add_argument("--openings", help="file with one start FEN per line (default: random openings)")
+    parser.add_argument("--opening-plies", type=int, default=4, help="random plies for generated openings")
+    parser.add_argument("--seed", type=int, default=1, help="random opening seed")
+    parser.add_argument("--workers", type=int, help="processes to use (default: one per CPU)")
+    parser.add_argument("--json", help="write the summary and every game to this JSON file")
+    parser.add_argument("--csv", help="append the summary as a row to this CSV file")
+    parser.add_argument("--archive", help="append every game's moves to this game archive")
+    args = parser.parse_args()
+
+    configs = {'a': parse_config(args.engine_a), 'b': parse_config(args.engine_b)}
+    for config in configs.values():
+        create_ai(ChessBoard(), INDEX_COLOR[WHITE_IDX], config).close()
+    pairs = (args.games + 1) // 2
+    if args.openings:
+        with open(args.openings) as f:
+            fens = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        openings = [fens[index % len(fens)] for index in range(pairs)]
+    else:
+        openings = random_openings(pairs, args.opening_plies, args.seed) if args.opening_plies else [START_FEN] * pairs
+    tasks = [(index * 2 + swap, fen, WHITE_IDX if swap == 0 else BLACK_IDX, configs, args.movetime, args.depth)
+             for index, fen in enumerate(openings) for swap in (0, 1)]
+
+    games = []
+    start = time.perf_counter()
+    # Not a multiprocessing.Pool: its daemonic workers could not start the
+    # helper processes of an engine with workers > 1
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(args.workers, mp_context=context) as pool:
+        for future in as_completed([pool.submit(play_game, task) for task in tasks]):
+            game = future.result()
+            moves = game.pop('moves')
+            if args.archive:
+                # Result for White, from A's score and color
+                white_score = game['result'] if game['a_color'] == 'white' else 1 - game['result']
+                GameArchive.append(args.archive, moves, round(white_score * 2 - 1), game['opening'])
+            games.append(game)
+            score = sum(g['result'] for g in games)
+            print(f"game {len(games)}/{len(tasks)}: {game['result']} ({game['reason']}, {game['plies']} plies), "
+                  f"A {score:g}/{len(games)}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    games.sort(key=lambda game: game['game'])
+    summary = summarize(games, configs, args.movetime, args.depth)
+    print(f"A vs B: +{summary['wins']} ={summary['draws']} -{summary['losses']} "
+          f"score {summary['score']:.3f}, Elo {summary['elo']:+.0f} "
+          f"[{summary['elo_low']:+.0f}, {summary['elo_high']:+.0f}]")
+    print(f"A: {summary['nps_a']:.0f} nodes/s, {summary['ms_per_move_a']:.0f} ms/move; "
+          f"B: {summary['nps_b']:.0f} nodes/s, {summary['ms_per_move_b']:.0f} ms/move")
+    print(f"{len(games)} games in {elapsed:.0f}s ({len(games) * 3600 / elapsed:.0f} games/hour)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'summary': summary, 'games': games}, f, indent=2)
+    if args.csv:
+        write_csv(args.csv, summary)
+
+if __name__ == "__main__":
+    main()
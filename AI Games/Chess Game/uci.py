@@ -0,0 +1,182 @@
+import logging
+import os
+import sys
+import threading
+import time
+
+from chess import (ChessBoard, ChessAI, START_FEN, INDEX_COLOR, BOARD_SIZE, MATE_SCORE, MATE_BOUND,
+                   MAX_DEPTH, OPENING_BOOK_PATH, TABLEBASE_DIR, move_name, parse_square)
+
+# UCI front end: reads commands on stdin and answers on stdout, so the engine
+# can run under a chess GUI or a match server. Castling, en passant and
+# under-promotion aren't part of this game; promotions are always to a queen.
+
+ENGINE_NAME = "AI-Course Chess"
+
+def send(line):
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+class UCIEngine:
+    def __init__(self, stats=False):
+        self.stats = stats
+        self.board = ChessBoard()
+        self.ais = {}
+        self.search = None
+        self.search_stop = None
+        self.search_start = 0.0
+
+    def ai_for(self, side):
+        # One AI per color: the search scores positions from its own side, so
+        # the two colors can't share a transposition table
+        if side not in self.ais:
+            book_path = OPENING_BOOK_PATH if os.path.exists(OPENING_BOOK_PATH) else None
+            tablebase_dir = TABLEBASE_DIR if os.path.isdir(TABLEBASE_DIR) else None
+            try:
+                self.ais[side] = ChessAI(self.board, INDEX_COLOR[side], book_path=book_path,
+                                         tablebase_dir=tablebase_dir, stats=self.stats)
+            except ValueError as error:
+                # A damaged book file: play without the book
+                logging.warning("%s; playing without the opening book", error)
+                self.ais[side] = ChessAI(self.board, INDEX_COLOR[side], tablebase_dir=tablebase_dir,
+                                         stats=self.stats)
+        return self.ais[side]
+
+    def new_game(self):
+        self.stop()
+        for ai in self.ais.values():
+            ai.close()
+        self.ais = {}
+        self.board = ChessBoard()
+
+    def set_position(self, args):
+        # position [startpos | fen <fen>] [moves <move>...]
+        self.stop()
+        moves = []
+        if 'moves' in args:
+            index = args.index('moves')
+            args, moves = args[:index], args[index + 1:]
+        fen = START_FEN
+        if args[:1] == ['fen']:
+            fen = ' '.join(args[1:])
+        elif args[:1] != ['startpos']:
+            send("info string expected startpos or fen")
+            return
+        board = ChessBoard()
+        try:
+            board.load_fen(fen)
+        except ValueError as error:
+            send(f"info string {error}")
+            return
+        for name in moves:
+            try:
+                move = (parse_square(name[:2]), parse_square(name[2:4]))
+            except (ValueError, IndexError):
+                move = None
+            if move not in board.generate_legal_moves(board.side):
+                send(f"info string illegal move {name}")
+                break
+            board.make_move(*move)
+        self.board = board
+
+    def go(self, args):
+        # go [movetime <ms>] [depth <n>] [wtime/btime <ms> [winc/binc <ms>]] [infinite]
+        self.stop()
+        options = {}
+        for index, arg in enumerate(args[:-1]):
+            if args[index + 1].lstrip('-').isdigit():
+                options[arg] = int(args[index + 1])
+
+        side = self.board.side
+        ai = self.ai_for(side)
+        ai.board = self.board
+        time_budget_ms = None
+        ai.depth = MAX_DEPTH
+        if 'depth' in options:
+            ai.depth = max(1, min(options['depth'], MAX_DEPTH))
+        elif 'movetime' in options:
+            time_budget_ms = options['movetime']
+        elif ('wtime', 'btime')[side] in options:
+            # Spend a slice of the clock plus most of the increment
+            remaining = options[('wtime', 'btime')[side]]
+            increment = options.get(('winc', 'binc')[side], 0)
+            time_budget_ms = max(10, min(remaining // 30 + increment * 3 // 4, remaining // 2))
+
+        self.search_stop = threading.Event()
+        ai.stop_event = self.search_stop
+        ai.on_iteration = self.report
+        self.search_start = time.perf_counter()
+        self.search = threading.Thread(target=self._search, args=(ai, time_budget_ms), daemon=True)
+        self.search.start()
+
+    def _search(self, ai, time_budget_ms):
+        move = ai.get_move(time_budget_ms=time_budget_ms)
+        if move is None:
+            send("bestmove 0000")
+            return
+        from_row, from_col, to_row, to_col = move
+        from_sq = from_row * BOARD_SIZE + from_col
+        send("bestmove " + move_name(self.board, from_sq, to_row * BOARD_SIZE + to_col))
+
+    def report(self, ai):
+        elapsed_ms = max(1, int((time.perf_counter() - self.search_start) * 1000))
+        score = ai.last_score
+        if abs(score) > MATE_BOUND:
+            plies = MATE_SCORE - abs(score)
+            score_text = f"mate {(plies + 1) // 2 if score > 0 else -(plies // 2)}"
+        else:
+            score_text = f"cp {score}"
+        # The PV is played out on a scratch board to name its moves
+        board = self.board.copy()
+        pv = []
+        for from_row, from_col, to_row, to_col in ai.pv:
+            from_sq = from_row * BOARD_SIZE + from_col
+            to_sq = to_row * BOARD_SIZE + to_col
+            pv.append(move_name(board, from_sq, to_sq))
+            board.make_move(from_sq, to_sq)
+        send(f"info depth {ai.completed_depth} score {score_text} nodes {ai.nodes} "
+             f"nps {ai.nodes * 1000 // elapsed_ms} time {elapsed_ms} pv {' '.join(pv)}")
+
+    def stop(self):
+        # Stop a running search; it still answers with its best move so far
+        if self.search is not None:
+            self.search_stop.set()
+            self.search.join()
+            self.search = None
+
+    def close(self):
+        self.stop()
+        for ai in self.ais.values():
+            ai.close()
+
+def main():
+    # With --stats, each search's statistics go to stderr as a JSON line
+    stats = '--stats' in sys.argv[1:]
+    if stats:
+        logging.basicConfig(stream=sys.stderr, level=logging.INFO, format='%(message)s')
+    engine = UCIEngine(stats=stats)
+    for line in sys.stdin:
+        args = line.split()
+        if not args:
+            continue
+        command, args = args[0], args[1:]
+        if command == 'uci':
+            send(f"id name {ENGINE_NAME}")
+            send("id author AI-Course")
+            send("uciok")
+        elif command == 'isready':
+            send("readyok")
+        elif command == 'ucinewgame':
+            engine.new_game()
+        elif command == 'position':
+            engine.set_position(args)
+        elif command == 'go':
+            engine.go(args)
+        elif command == 'stop':
+            engine.stop()
+        elif command == 'quit':
+            break
+    engine.close()
+
+if __name__ == "__main__":
+    main()